@@ -7,6 +7,33 @@ See the LICENSE file in the root of this project for the full license text.
 
 from django.contrib import admin
 
-from .models import UserPreferences
+from .models import Bar, OutboundEmail, UserPreferences, Watchlist, WatchlistSymbol
 
 admin.site.register(UserPreferences)
+
+
+@admin.register(Bar)
+class BarAdmin(admin.ModelAdmin):
+    list_display = ("symbol", "interval", "ts", "open", "high", "low", "close", "volume")
+    list_filter = ("interval",)
+    search_fields = ("symbol",)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("recipients", "created_at", "send_after", "attempts", "last_error")
+    exclude = ("message",)
+    search_fields = ("recipients",)
+
+
+class WatchlistSymbolInline(admin.TabularInline):
+    model = WatchlistSymbol
+    extra = 0
+
+
+@admin.register(Watchlist)
+class WatchlistAdmin(admin.ModelAdmin):
+    list_display = ("name", "user", "position")
+    list_select_related = ("user",)
+    search_fields = ("name", "user__username")
+    inlines = [WatchlistSymbolInline]
@@ -6,8 +6,21 @@ See the LICENSE file in the root of this project for the full license text.
 """
 
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from api import bars  # noqa: F401 Registers the "local" bar store provider
+        from api.models import UserPreferences, Watchlist, WatchlistSymbol
+        from api.preferences import invalidate
+        from api.sqlite import apply_pragmas
+
+        connection_created.connect(apply_pragmas, dispatch_uid="api.sqlite.apply_pragmas")
+        for model in [UserPreferences, Watchlist, WatchlistSymbol]:
+            for signal in [post_save, post_delete]:
+                signal.connect(invalidate, sender=model, dispatch_uid=f"api.preferences.invalidate.{model.__name__}")
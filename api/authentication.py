@@ -8,20 +8,37 @@ See the LICENSE file in the root of this project for the full license text.
 from allauth.account.models import EmailAddress
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.db.models import Exists, OuterRef, Q
+from rest_framework import serializers
 
 User = get_user_model()
 
 
+def get_login_user(identifier: str | None):
+    """
+    The user with `identifier` as its email or username, annotated with whether that email is verified
+    (`email_verified`), in one query for the whole login.
+    """
+    if not identifier:
+        return None
+    verified = EmailAddress.objects.filter(user=OuterRef("pk"), email=OuterRef("email"), verified=True)
+    users = User.objects.annotate(email_verified=Exists(verified))
+    return users.filter(Q(email__iexact=identifier) | Q(username=identifier)).order_by("pk").first()
+
+
 class VerifiedEmailBackend(ModelBackend):
-    def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            user = User.objects.get(email=username)
-            if not EmailAddress.objects.filter(user=user, email=user.email, verified=True).exists():
-                raise Exception({"email": "Email address is not verified."})
-                # raise serializers.ValidationError({"email": "Email address is not verified."})
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        if password is None:
+            return None
+        user = get_login_user(email or username)
+        if user is None:
+            # Hashed anyway so that an unknown user takes as long as a wrong password (as in ModelBackend)
+            User().set_password(password)
             return None
-        except Exception:
-            raise
+        if not user.check_password(password) or not self.user_can_authenticate(user):
+            # Stops the next backends from looking the same user up again only to reach the same answer
+            raise PermissionDenied
+        if not user.email_verified:
+            raise serializers.ValidationError({"email": "Email address is not verified."})
+        return user
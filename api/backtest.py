@@ -0,0 +1,205 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Vectorized backtests of entry and exit conditions written in the expression language (api/expressions.py). Signals
+are taken at a bar's close and filled at the next bar's open, so a backtest never trades on a price it could not have
+seen. Every step, from the signals to the positions, fills and equity curve, is a whole-series array operation; a
+symbol costs about as much as evaluating its expressions.
+"""
+
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING
+
+from api import indicators
+from api.expressions import compile_expression
+from api.lazy import np, pd
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# The squeeze fires (was on, is off) with momentum up, and is held until the momentum fades
+DEFAULT_ENTRY = "squeeze_on[1] and not squeeze_on and squeeze > 0"
+DEFAULT_EXIT = "squeeze < squeeze[1]"
+SIDES = {"long": 1, "short": -1}
+
+
+@dataclass(frozen=True)
+class Strategy:
+    entry: str = DEFAULT_ENTRY
+    exit: str = DEFAULT_EXIT
+    side: str = "long"
+    # Charged on the traded value of every fill, in basis points
+    cost_bps: float = 0.0
+
+    def __post_init__(self):
+        if self.side not in SIDES:
+            raise ValueError(f"Invalid side '{self.side}', one of {', '.join(SIDES)}")
+        # Invalid expressions are rejected up front rather than per symbol, templates once they are formatted
+        for expression in [self.entry, self.exit]:
+            if "{" not in expression:
+                compile_expression(expression)
+
+    def format(self, **params) -> "Strategy":
+        """The strategy with `{name}` placeholders in its expressions filled in, for parameter sweeps."""
+        try:
+            return replace(self, entry=self.entry.format(**params), exit=self.exit.format(**params))
+        except KeyError as e:
+            raise ValueError(f"No value for the placeholder {e} in the sweep")
+
+
+@dataclass
+class Result:
+    symbol: str
+    index: "pd.DatetimeIndex"
+    # Position held during each bar (1, -1 or 0) and the equity at its close, starting from 1
+    position: "np.ndarray"
+    equity: "np.ndarray"
+    trades: list[dict] = field(default_factory=list)
+    stats: dict = field(default_factory=dict)
+
+    @property
+    def returns(self) -> "np.ndarray":
+        return np.diff(self.equity, prepend=1.0) / np.concatenate([[1.0], self.equity[:-1]])
+
+
+def forward_fill(values: "np.ndarray", initial: float) -> "np.ndarray":
+    valid = ~np.isnan(values)
+    last = np.maximum.accumulate(np.where(valid, np.arange(len(values)), -1))
+    return np.where(last >= 0, values[np.maximum(last, 0)], initial)
+
+
+def targets(entry: "np.ndarray", exit: "np.ndarray") -> "np.ndarray":
+    """1 from a bar with an entry signal until the next with an exit signal (an exit wins a tie), 0 otherwise."""
+    events = np.where(exit != 0, 0.0, np.where(entry != 0, 1.0, np.nan))
+    return forward_fill(events, 0.0)
+
+
+def run(symbol: str, df: "DataFrame", strategy: Strategy) -> Result:
+    ctx = indicators.Context(df)  # Shared by both expressions
+    entry = compile_expression(strategy.entry).evaluate(ctx)
+    exit = compile_expression(strategy.exit).evaluate(ctx)
+    target = targets(entry, exit) * SIDES[strategy.side]
+
+    open_, close = ctx.values("open"), ctx.values("close")
+    # Decided at the close of bar t, held from the open of bar t + 1
+    held = indicators.shift(target, 1)
+    held[:1] = 0
+    previous = indicators.shift(held, 1)
+    previous[:1] = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        overnight = np.nan_to_num(previous * (open_ / indicators.shift(close, 1) - 1))
+        intraday = held * (close / open_ - 1)
+    cost = np.abs(held - previous) * strategy.cost_bps / 10_000
+    equity = np.cumprod((1 + overnight) * (1 - cost) * (1 + intraday))
+
+    result = Result(symbol, df.index, held, equity, trades(df.index, open_, close, held, previous, strategy))
+    result.stats = statistics(result)
+    return result
+
+
+def trades(index, open_, close, held, previous, strategy: Strategy) -> list[dict]:
+    entries = np.flatnonzero((held != 0) & (previous == 0))
+    exits = np.flatnonzero((held == 0) & (previous != 0))
+    side = SIDES[strategy.side]
+    # A position still open at the end is valued at the last close, with only its entry paid for (as in the equity)
+    exit_prices = np.concatenate([open_[exits], close[-1:]])[: len(entries)]
+    fills = np.where(np.arange(len(entries)) < len(exits), 2, 1)
+    cost = (1 - strategy.cost_bps / 10_000) ** fills
+    returns = ((1 + side * (exit_prices / open_[entries] - 1)) * cost - 1).tolist()
+    exit_times = [index[i].to_pydatetime() for i in exits] + [None]
+    return [
+        {
+            "entry": index[i].to_pydatetime(),
+            "exit": exit_times[n],
+            "entry_price": float(open_[i]),
+            "exit_price": float(exit_prices[n]),
+            "return": returns[n],
+        }
+        for n, i in enumerate(entries)
+    ]
+
+
+def statistics(result: Result) -> dict:
+    equity, returns = result.equity, result.returns
+    if not len(equity):
+        return dict.fromkeys(["total_return", "cagr", "sharpe", "max_drawdown", "exposure", "win_rate"], 0.0) | {
+            "trades": 0
+        }
+    years = max((result.index[-1] - result.index[0]).days / 365.25, 1 / 365.25)
+    periods_per_year = len(equity) / years
+    deviation = returns.std()
+    drawdown = 1 - equity / np.maximum.accumulate(equity)
+    wins = [trade["return"] > 0 for trade in result.trades]
+    return {
+        "total_return": float(equity[-1] - 1),
+        "cagr": float(equity[-1] ** (1 / years) - 1) if equity[-1] > 0 else -1.0,
+        "sharpe": float(returns.mean() / deviation * np.sqrt(periods_per_year)) if deviation else 0.0,
+        "max_drawdown": float(drawdown.max()),
+        # Share of bars in the market, or the average gross position of a portfolio
+        "exposure": float(np.abs(result.position).mean()),
+        "trades": len(result.trades),
+        "win_rate": float(np.mean(wins)) if wins else 0.0,
+    }
+
+
+def portfolio(results: list[Result]) -> Result:
+    """Equal weight across the symbols, rebalanced every bar, over the union of their bars."""
+    returns = pd.DataFrame({result.symbol: pd.Series(result.returns, index=result.index) for result in results})
+    combined = returns.mean(axis=1, skipna=True).fillna(0).to_numpy()
+    positions = pd.DataFrame({result.symbol: pd.Series(result.position, index=result.index) for result in results})
+    combined_result = Result(
+        "portfolio",
+        returns.index,
+        positions.abs().mean(axis=1).fillna(0).to_numpy(),
+        np.cumprod(1 + combined),
+        [trade | {"symbol": result.symbol} for result in results for trade in result.trades],
+    )
+    combined_result.stats = statistics(combined_result)
+    return combined_result
+
+
+def run_many(frames: dict[str, "DataFrame"], strategy: Strategy) -> tuple[dict[str, Result], Result]:
+    results = {symbol: run(symbol, df, strategy) for symbol, df in frames.items() if not df.empty}
+    return results, portfolio(list(results.values()))
+
+
+# Frames of the sweep, set in each worker of the pool (inherited when forked)
+sweep_frames: dict = {}
+
+
+def init_sweep_worker(frames: dict):
+    global sweep_frames
+    sweep_frames = frames
+
+
+def sweep_worker(strategy: Strategy) -> dict:
+    return run_many(sweep_frames, strategy)[1].stats
+
+
+def sweep(
+    frames: dict[str, "DataFrame"], strategy: Strategy, grid: dict[str, list], workers: int | None = None
+) -> list[tuple[dict, dict]]:
+    """
+    Portfolio statistics of `strategy` for every combination of the `grid` values filled into its placeholders, e.g.
+    entry "close > ema(close, {length})" with {"length": [10, 20, 50]}. Combinations run across a process pool.
+    """
+    combinations = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    strategies = [strategy.format(**params) for params in combinations]
+    workers = min(workers or os.cpu_count() or 1, len(strategies))
+    if workers <= 1:
+        init_sweep_worker(frames)
+        stats = [sweep_worker(strategy) for strategy in strategies]
+    else:
+        # Forked workers share the frames copy-on-write instead of each unpickling them
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        with ProcessPoolExecutor(workers, context, init_sweep_worker, (frames,)) as pool:
+            stats = list(pool.map(sweep_worker, strategies))
+    return list(zip(combinations, stats))
@@ -0,0 +1,82 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+from typing import TYPE_CHECKING
+
+from django.db import connections, transaction
+
+from api.lazy import np, pd
+from api.models import Bar
+from api.providers import OHLCV_COLUMNS, Provider, ProviderError, register_provider
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+BAR_FIELDS = ["ts"] + OHLCV_COLUMNS
+INGEST_BATCH_SIZE = 5000
+
+
+def to_epoch(index) -> "np.ndarray":
+    return pd.DatetimeIndex(index).values.astype("datetime64[s]").astype(np.int64)
+
+
+def ingest_bars(symbol: str, interval: str, df: "DataFrame", batch_size: int = INGEST_BATCH_SIZE) -> int:
+    """Upsert a normalized frame (see `providers.normalize_frame`) into the bar store, returning the rows written."""
+    epochs = to_epoch(df.index).tolist()
+    columns = [df[column].to_numpy(dtype=np.float64).tolist() for column in OHLCV_COLUMNS]
+    with transaction.atomic():
+        for start in range(0, len(epochs), batch_size):
+            end = start + batch_size
+            bars = [
+                Bar(symbol=symbol, interval=interval, ts=ts, open=o, high=h, low=low, close=c, volume=v)
+                for ts, o, h, low, c, v in zip(epochs[start:end], *(column[start:end] for column in columns))
+            ]
+            Bar.objects.bulk_create(
+                bars,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["symbol", "interval", "ts"],
+                update_fields=OHLCV_COLUMNS,
+            )
+    return len(epochs)
+
+
+def read_bars(symbol: str, interval: str, start: int | None = None, end: int | None = None) -> dict[str, "np.ndarray"]:
+    """Read a range of bars (epoch seconds, end exclusive) as one array per field without instantiating models."""
+    queryset = Bar.objects.filter(symbol=symbol, interval=interval)
+    if start is not None:
+        queryset = queryset.filter(ts__gte=start)
+    if end is not None:
+        queryset = queryset.filter(ts__lt=end)
+    queryset = queryset.order_by("ts").values_list(*BAR_FIELDS)
+    # The ORM only builds the (portable) SQL, the rows go straight from the cursor into one array
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    values = np.ascontiguousarray(np.array(rows, dtype=np.float64).reshape(-1, len(BAR_FIELDS)).T)
+    arrays = {field: values[i] for i, field in enumerate(BAR_FIELDS)}
+    arrays["ts"] = arrays["ts"].astype(np.int64)
+    return arrays
+
+
+def bars_to_frame(arrays: dict[str, "np.ndarray"]) -> "DataFrame":
+    index = pd.DatetimeIndex(arrays["ts"].astype("datetime64[s]").astype("datetime64[ns]"), name="date")
+    return pd.DataFrame({column: arrays[column] for column in OHLCV_COLUMNS}, index=index)
+
+
+class BarStoreProvider(Provider):
+    name = "local"
+
+    def fetch(self, symbol: str, interval: str = "1d") -> "DataFrame":
+        arrays = read_bars(symbol, interval)
+        if not len(arrays["ts"]):
+            raise ProviderError(f"No stored bars for '{symbol}' ({interval})")
+        return bars_to_frame(arrays)
+
+
+register_provider(BarStoreProvider.name, BarStoreProvider)
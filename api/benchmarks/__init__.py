@@ -0,0 +1,106 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from django.db import connection
+
+from api.lazy import np, pd
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# Baseline results are committed so that a change can be diffed against them, lower values are always better
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "baselines")
+
+# Suites runnable through `manage.py benchmark <suite>`, each module provides `add_arguments(parser)` and
+# `run(stdout, **options) -> dict` returning the metrics to diff against the baseline
+SUITES = {
+    "backtest": "api.benchmarks.backtest",
+    "bars": "api.benchmarks.bars",
+    "compact": "api.benchmarks.compact",
+    "earnings": "api.benchmarks.earnings",
+    "export": "api.benchmarks.export",
+    "graphql": "api.benchmarks.graphql",
+    "indicators": "api.benchmarks.indicators",
+    "logging": "api.benchmarks.log",
+    "login": "api.benchmarks.login",
+    "middleware": "api.benchmarks.middleware",
+    "scan": "api.benchmarks.scan",
+    "shared_cache": "api.benchmarks.shared_cache",
+    "sqlite": "api.benchmarks.sqlite",
+}
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load_baseline(name: str) -> dict | None:
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(name: str, results: dict):
+    with open(baseline_path(name), "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(baseline: dict, results: dict) -> list[tuple[str, float, float, float]]:
+    """Return (metric, baseline, current, percent change) for every metric present in both."""
+    changes = []
+    for metric, current in results.items():
+        previous = baseline.get(metric)
+        if not isinstance(previous, (int, float)) or not isinstance(current, (int, float)) or not previous:
+            continue
+        changes.append((metric, previous, current, (current - previous) / previous * 100))
+    return changes
+
+
+def median_time(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def synthetic_ohlcv(bars: int, start: str = "2000-01-03", freq: str = "B", seed: int = 0) -> "DataFrame":
+    """A random walk in the normalized provider schema (see `providers.normalize_frame`)."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+    open_ = np.concatenate([[close[0]], close[:-1]]) * (1 + rng.normal(0, 0.002, bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.005, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.005, bars)))
+    volume = rng.integers(100_000, 10_000_000, bars).astype(np.float64)
+    index = pd.date_range(start, periods=bars, freq=freq, name="date")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume}, index=index)
+
+
+@contextmanager
+def benchmark_database():
+    """Run against a freshly migrated throwaway database, on disk for SQLite so journaling costs are included."""
+    with tempfile.TemporaryDirectory() as directory:
+        if connection.vendor == "sqlite":
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,41 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import os
+
+from api import backtest
+from api.benchmarks import median_time, synthetic_ohlcv
+
+SWEEP_ENTRY = "close > ema(close, {length})"
+SWEEP_EXIT = "close < ema(close, {length})"
+
+
+def add_arguments(parser):
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--bars", type=int, default=5040, help="Daily bars per symbol (20 years)")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 20, 50, 100], help="EMA lengths to sweep")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3)
+
+
+def run(stdout, symbols=500, bars=5040, lengths=(10, 20, 50, 100), workers=1, repeat=3, **options) -> dict:
+    frames = {f"SYM{i}": synthetic_ohlcv(bars, seed=i) for i in range(symbols)}
+    strategy = backtest.Strategy(cost_bps=5)
+    elapsed = median_time(lambda: backtest.run_many(frames, strategy), repeat)
+    stdout.write(f"squeeze strategy over {symbols} symbols x {bars} bars: {elapsed:.2f}s")
+
+    results: dict = {
+        "params": {"symbols": symbols, "bars": bars, "lengths": list(lengths), "workers": workers},
+        "run_s": round(elapsed, 3),
+    }
+    template = backtest.Strategy(SWEEP_ENTRY, SWEEP_EXIT, cost_bps=5)
+    grid = {"length": list(lengths)}
+    for count in sorted({1, workers}):
+        sweep = median_time(lambda: backtest.sweep(frames, template, grid, count), 1)
+        stdout.write(f"sweep of {len(lengths)} EMA lengths with {count} workers: {sweep:.2f}s")
+        results[f"sweep_{count}_workers_s"] = round(sweep, 3)
+    return results
@@ -0,0 +1,47 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+
+from api.bars import ingest_bars, read_bars, to_epoch
+from api.benchmarks import benchmark_database, median_time, synthetic_ohlcv
+
+
+def add_arguments(parser):
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--bars", type=int, default=5000, help="Daily bars per symbol")
+    parser.add_argument("--repeat", type=int, default=5)
+
+
+def run(stdout, symbols=20, bars=5000, repeat=5, **options) -> dict:
+    frames = {f"SYM{i}": synthetic_ohlcv(bars, seed=i) for i in range(symbols)}
+    rows = symbols * bars
+    with benchmark_database():
+        start = time.perf_counter()
+        for symbol, df in frames.items():
+            ingest_bars(symbol, "1d", df)
+        ingest = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for symbol, df in frames.items():
+            ingest_bars(symbol, "1d", df)
+        upsert = time.perf_counter() - start
+
+        year_start = int(to_epoch(frames["SYM0"].index[-252:])[0])
+        read_full = median_time(lambda: read_bars("SYM0", "1d"), repeat)
+        read_year = median_time(lambda: read_bars("SYM0", "1d", start=year_start), repeat)
+
+    stdout.write(f"Ingest: {rows:,} rows in {ingest:.3f}s ({rows / ingest:,.0f} rows/s)")
+    stdout.write(f"Upsert: {rows:,} rows in {upsert:.3f}s ({rows / upsert:,.0f} rows/s)")
+    stdout.write(f"Range read: {read_full * 1000:.2f} ms for {bars:,} bars, {read_year * 1000:.2f} ms for 252 bars")
+    return {
+        "params": {"symbols": symbols, "bars": bars},
+        "ingest_seconds": round(ingest, 4),
+        "upsert_seconds": round(upsert, 4),
+        "read_full_ms": round(read_full * 1000, 3),
+        "read_year_ms": round(read_year * 1000, 3),
+    }
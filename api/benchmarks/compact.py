@@ -0,0 +1,62 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import pickle
+
+from api.benchmarks import median_time, synthetic_ohlcv
+from api.lazy import np
+from api.schema import add_indicators
+from api.series import CompactFrame
+
+
+def add_arguments(parser):
+    parser.add_argument("--bars", type=int, default=5000, help="Daily bars per frame")
+    parser.add_argument("--repeat", type=int, default=5)
+
+
+def frame_bytes(df) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def run(stdout, bars=5000, repeat=5, **options) -> dict:
+    history = synthetic_ohlcv(bars)
+    indicators = history.copy()
+    add_indicators(indicators)
+    indicators.fillna(0, inplace=True)
+
+    results: dict = {"params": {"bars": bars}}
+    for name, df in [("history", history), ("indicators", indicators)]:
+        compacted = CompactFrame.from_frame(df)
+        sizes = {
+            "memory": (frame_bytes(df), compacted.nbytes),
+            "pickle": (
+                len(pickle.dumps(df, pickle.HIGHEST_PROTOCOL)),
+                len(pickle.dumps(compacted, pickle.HIGHEST_PROTOCOL)),
+            ),
+        }
+        narrowed = sum(values.dtype.itemsize < 8 for values in compacted.columns.values())
+        stdout.write(
+            f"{name:>10} ({len(df.columns)} columns, {narrowed} narrowed): "
+            + ", ".join(
+                f"{kind} {full / bars:.1f} -> {small / bars:.1f} bytes/bar" for kind, (full, small) in sizes.items()
+            )
+        )
+        for kind, (full, small) in sizes.items():
+            results[f"{name}.{kind}_bytes_per_bar"] = round(small / bars, 2)
+            results[f"{name}.{kind}_full_bytes_per_bar"] = round(full / bars, 2)
+        results[f"{name}.compact_ms"] = round(median_time(lambda: CompactFrame.from_frame(df), repeat) * 1000, 3)
+        results[f"{name}.expand_ms"] = round(median_time(compacted.to_frame, repeat) * 1000, 3)
+
+    # Indicators computed from the compacted history, against the full precision ones
+    from_compact = CompactFrame.from_frame(history).to_frame()
+    add_indicators(from_compact)
+    from_compact.fillna(0, inplace=True)
+    scale = np.maximum(np.abs(indicators.to_numpy()), 1.0)
+    error = float((np.abs(from_compact.to_numpy() - indicators.to_numpy()) / scale).max())
+    stdout.write(f"Largest indicator difference from compacted history: {error:.2e} (relative)")
+    results["indicators.max_relative_error"] = error
+    return results
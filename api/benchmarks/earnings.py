@@ -0,0 +1,103 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import pickle
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test.utils import override_settings
+
+from api import schema as schema_module
+from api.benchmarks import benchmark_database, median_time
+from api.earnings import EarningsCalendar
+from api.lazy import np, pd
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "market_data": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"},
+    "preferences": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"},
+}
+QUERY = """
+query ($start: Date, $end: Date) {
+    getEarningsCalendar(start: $start, end: $end) {
+        success
+        earnings { symbol name reportDate fiscalDateEnding estimate currency }
+    }
+}
+"""
+START = date(2025, 1, 6)
+
+
+def synthetic_calendar(reports: int, seed: int = 0) -> "pd.DataFrame":
+    """A year of reports (as the CSV gives them, strings in no particular order), bunched in the reporting seasons."""
+    rng = np.random.default_rng(seed)
+    days = (rng.beta(2, 2, reports) * 60 + np.tile([0, 91, 182, 273], reports // 4 + 1)[:reports]).astype(int)
+    report_dates = pd.to_datetime(START) + pd.to_timedelta(days, unit="D")
+    return pd.DataFrame(
+        {
+            "symbol": [f"S{i:05d}" for i in range(reports)],
+            "name": [f"Company {i}" for i in range(reports)],
+            "reportDate": report_dates.strftime("%Y-%m-%d"),
+            "fiscalDateEnding": (report_dates - pd.Timedelta(days=30)).strftime("%Y-%m-%d"),
+            "estimate": np.where(rng.random(reports) < 0.7, np.round(rng.normal(1, 1, reports), 2).astype(str), ""),
+            "currency": "USD",
+        }
+    )
+
+
+def add_arguments(parser):
+    parser.add_argument("--reports", type=int, default=12000, help="Reports in the calendar (about a year)")
+    parser.add_argument("--repeat", type=int, default=5)
+
+
+def run(stdout, reports=12000, repeat=5, **options) -> dict:
+    df = synthetic_calendar(reports)
+    calendar = EarningsCalendar.from_frame(df)
+    build = median_time(lambda: EarningsCalendar.from_frame(df), repeat)
+    pickled = pickle.dumps(calendar)
+    unpickle = median_time(lambda: pickle.loads(pickled), repeat)
+    stdout.write(
+        f"index of {reports} reports: built in {build * 1000:.1f} ms, {len(pickled) / 1024:.0f} KiB "
+        f"unpickled in {unpickle * 1000:.2f} ms"
+    )
+    results: dict = {
+        "params": {"reports": reports},
+        "build_ms": round(build * 1000, 3),
+        "unpickle_ms": round(unpickle * 1000, 3),
+    }
+
+    # The lookup it replaces, a mask over the parsed frame
+    parsed = df.assign(reportDate=pd.to_datetime(df["reportDate"]))
+    with (
+        benchmark_database(),
+        override_settings(CACHES=CACHES),
+        patch("api.schema.get_earnings_dates", lambda symbol, api_key: df),
+    ):
+        context = SimpleNamespace(user=User.objects.create_user(username="benchmark"))
+        for window in [7, 31]:
+            start, end = START + timedelta(days=21), START + timedelta(days=21 + window - 1)
+            count = len(calendar.between(start, end))
+            low, high = pd.Timestamp(start), pd.Timestamp(end)
+            mask = median_time(lambda: parsed[(parsed["reportDate"] >= low) & (parsed["reportDate"] <= high)], repeat)
+            search = median_time(lambda: calendar.between(start, end), repeat)
+            records = median_time(lambda: calendar.between(start, end).records(), repeat)
+            variables = {"start": start.isoformat(), "end": end.isoformat()}
+            execute = median_time(
+                lambda: schema_module.schema.execute(QUERY, variables=variables, context_value=context), repeat
+            )
+            stdout.write(
+                f"{window:>2} days, {count} reports: mask {mask * 1000:.3f} ms, searchsorted {search * 1000:.3f} ms, "
+                f"records {records * 1000:.2f} ms, getEarningsCalendar {execute * 1000:.1f} ms"
+            )
+            results[f"{window}d.reports"] = count
+            results[f"{window}d.mask_ms"] = round(mask * 1000, 3)
+            results[f"{window}d.searchsorted_ms"] = round(search * 1000, 3)
+            results[f"{window}d.records_ms"] = round(records * 1000, 3)
+            results[f"{window}d.execute_ms"] = round(execute * 1000, 3)
+    return results
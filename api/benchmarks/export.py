@@ -0,0 +1,61 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+import tracemalloc
+from importlib.util import find_spec
+from unittest.mock import patch
+
+from api.benchmarks import synthetic_ohlcv
+from api.export import Export
+
+INDICATORS = [{"name": "rsi", "params": {"length": 14}}, {"name": "macd"}]
+
+
+def add_arguments(parser):
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--bars", type=int, default=5040, help="Daily bars per symbol (20 years)")
+
+
+def drain(export: Export) -> int:
+    size = 0
+    for data in export.stream():
+        size += len(data)
+    return size
+
+
+def run(stdout, symbols=100, bars=5040, **options) -> dict:
+    frames = {f"SYM{i}": synthetic_ohlcv(bars, seed=i) for i in range(symbols)}
+    formats = ["csv"] + (["parquet"] if find_spec("pyarrow") else [])
+    results: dict = {"params": {"symbols": symbols, "bars": bars, "formats": formats}}
+    with patch("api.export.get_bars", lambda symbol, interval: frames[symbol]):
+        for export_format in formats:
+            export = Export.from_request({"symbols": list(frames), "indicators": INDICATORS, "format": export_format})
+            start = time.perf_counter()
+            size = drain(export)
+            elapsed = time.perf_counter() - start
+            rows = symbols * bars
+            stdout.write(
+                f"{export_format:>7}: {rows} rows in {elapsed:.2f}s, {rows / elapsed:,.0f} rows/s, "
+                f"{size / 1024 / 1024:.1f} MiB"
+            )
+            results[f"{export_format}.rows_per_s"] = round(rows / elapsed)
+            results[f"{export_format}.us_per_row"] = round(elapsed / rows * 1e6, 3)
+            results[f"{export_format}.bytes_per_row"] = round(size / rows, 1)
+
+            # The memory allocated while streaming does not grow with the number of symbols
+            for count in sorted({max(1, symbols // 10), symbols}):
+                subset = Export.from_request(
+                    {"symbols": list(frames)[:count], "indicators": INDICATORS, "format": export_format}
+                )
+                tracemalloc.start()
+                drain(subset)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                stdout.write(f"{export_format:>7}: {count} symbols peak at {peak / 1024 / 1024:.1f} MiB")
+                results[f"{export_format}.{count}_symbols.peak_mib"] = round(peak / 1024 / 1024, 2)
+    return results
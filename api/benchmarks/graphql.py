@@ -0,0 +1,159 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import schema as schema_module
+from api.benchmarks import benchmark_database, median_time, synthetic_ohlcv
+from api.lazy import pd
+from api.market_data import get_history
+
+CHART_QUERY = """
+query ($ticker: String!) {
+    getChartData(ticker: $ticker) {
+        success
+        message
+        ohlc { x y }
+        volume { x y }
+        squeeze { x y }
+        kc { x y }
+        earnings { symbol reportDate fiscalDateEnding estimate }
+    }
+}
+"""
+
+AUTOCOMPLETE_QUERY = """
+query ($query: String!) {
+    getAutocomplete(query: $query) {
+        success
+        message
+        results { symbol name cik }
+    }
+}
+"""
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "market_data": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"},
+}
+
+
+class StubOBB:
+    """Stands in for `obb`, so the suite measures our code instead of the network (and skips importing OpenBB)."""
+
+    def __init__(self, frames: dict, search_results: list):
+        self.frames = frames
+        self.user = SimpleNamespace(credentials=SimpleNamespace())
+        self.equity = SimpleNamespace(
+            price=SimpleNamespace(historical=self.historical),
+            search=lambda query: SimpleNamespace(results=search_results),
+        )
+
+    def historical(self, symbol, interval="1d", provider=None):
+        return SimpleNamespace(to_df=lambda: self.frames[symbol].copy())
+
+
+def synthetic_earnings(symbol: str) -> "pd.DataFrame":
+    dates = pd.date_range("2024-01-30", periods=8, freq="QS")
+    return pd.DataFrame(
+        {
+            "symbol": symbol,
+            "name": f"{symbol} Inc",
+            "reportDate": dates.strftime("%Y-%m-%d"),
+            "fiscalDateEnding": (dates - pd.Timedelta(days=30)).strftime("%Y-%m-%d"),
+            "estimate": ["1.59"] + [""] * 7,
+            "currency": "USD",
+        }
+    )
+
+
+def add_arguments(parser):
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="Bars per chart")
+    parser.add_argument("--repeat", type=int, default=3)
+
+
+def run(stdout, sizes=(1000, 10000, 50000), repeat=3, **options) -> dict:
+    # Intraday bars, years of daily bars are far fewer than 50k
+    frames = {f"BENCH{size}": synthetic_ohlcv(size, start="2023-01-02", freq="15min") for size in sizes}
+    search_results = [{"symbol": f"SYM{i}", "name": f"Company {i}", "cik": str(i)} for i in range(25)]
+    stub = StubOBB(frames, search_results)
+    results: dict = {"params": {"sizes": list(sizes)}}
+
+    with (
+        benchmark_database(),
+        override_settings(CACHES=CACHES, MARKET_DATA_PROVIDERS=["alpha_vantage"], ALLOWED_HOSTS=["testserver"]),
+        patch("api.providers.obb", stub),
+        patch("api.schema.obb", stub),
+        patch("api.schema.get_earnings_dates", lambda symbol, api_key: synthetic_earnings(symbol)),
+    ):
+        user = User.objects.create_user(username="benchmark")
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        context = RequestFactory().get("/")
+        context.user = user
+        url = reverse("graphql")
+
+        for size in sizes:
+            ticker = f"BENCH{size}"
+            variables = {"ticker": ticker}
+            # Cold path pieces: the (stubbed) provider fetch with normalization and bar store upsert, then indicators
+            fetch = median_time(lambda: get_history(ticker, refresh=True), repeat)
+            history = get_history(ticker)
+            indicators = median_time(lambda: schema_module.add_indicators(history.copy()), repeat)
+
+            # Warm path: with the frames cached what remains is building and completing the GraphQL result
+            execution = schema_module.schema.execute(CHART_QUERY, variables=variables, context_value=context)
+            if execution.errors or not execution.data["getChartData"]["success"]:
+                raise Exception(f"Chart query failed: {execution.errors or execution.data}")
+            serialization = median_time(
+                lambda: schema_module.schema.execute(CHART_QUERY, variables=variables, context_value=context), repeat
+            )
+            encode = median_time(lambda: json.dumps({"data": execution.data}, separators=(",", ":")), repeat)
+            http = median_time(
+                lambda: client.post(
+                    url, {"query": CHART_QUERY, "variables": variables}, content_type="application/json"
+                ),
+                repeat,
+            )
+            stage_results = {
+                "fetch": fetch,
+                "indicators": indicators,
+                "serialization": serialization,
+                "json_encode": encode,
+                "http": http,
+            }
+            stdout.write(
+                f"getChartData {size:>6} bars: "
+                + ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in stage_results.items())
+            )
+            for stage, seconds in stage_results.items():
+                results[f"chart.{size}.{stage}_ms"] = round(seconds * 1000, 3)
+
+        variables = {"query": "SYM"}
+        execute = median_time(
+            lambda: schema_module.schema.execute(AUTOCOMPLETE_QUERY, variables=variables, context_value=context),
+            repeat * 10,
+        )
+        http = median_time(
+            lambda: client.post(
+                url, {"query": AUTOCOMPLETE_QUERY, "variables": variables}, content_type="application/json"
+            ),
+            repeat * 10,
+        )
+        stdout.write(
+            f"getAutocomplete {len(search_results)} results: execute {execute * 1000:.2f} ms, http {http * 1000:.2f} ms"
+        )
+        results["autocomplete.execute_ms"] = round(execute * 1000, 3)
+        results["autocomplete.http_ms"] = round(http * 1000, 3)
+    return results
@@ -0,0 +1,56 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+from api import indicators
+from api.benchmarks import median_time, synthetic_ohlcv
+from api.schema import add_indicators
+
+# Expressions have no default to time
+ALL_INDICATORS = [{"name": name} for name in sorted(indicators.registry()) if name != "expr"]
+
+
+def add_arguments(parser):
+    parser.add_argument("--bars", type=int, default=5000, help="Daily bars per frame")
+    parser.add_argument("--repeat", type=int, default=10)
+
+
+def unshared(df, specs):
+    # Every indicator with a context of its own, as if nothing were shared
+    for spec in specs:
+        indicators.append(df, [indicators.from_spec(spec)])
+
+
+def pandas_ta_defaults(df):
+    import pandas_ta  # noqa: F401
+
+    df.ta.kc(append=True, scalar=1.0)
+    df.ta.kc(append=True, scalar=2.0)
+    df.ta.kc(append=True, scalar=3.0)
+    df.ta.squeeze(append=True)
+
+
+def run(stdout, bars=5000, repeat=10, **options) -> dict:
+    history = synthetic_ohlcv(bars)
+    results: dict = {"params": {"bars": bars}}
+    runs = {
+        "defaults.shared": lambda: add_indicators(history.copy()),
+        "defaults.unshared": lambda: unshared(history.copy(), indicators.DEFAULT_INDICATORS),
+        "all.shared": lambda: indicators.append(history.copy(), [indicators.from_spec(s) for s in ALL_INDICATORS]),
+        "all.unshared": lambda: unshared(history.copy(), ALL_INDICATORS),
+    }
+    try:
+        import pandas_ta  # noqa: F401
+
+        runs["defaults.pandas_ta"] = lambda: pandas_ta_defaults(history.copy())
+    except ImportError:
+        stdout.write("pandas_ta is not installed, not comparing against it")
+
+    for name, fn in runs.items():
+        elapsed = median_time(fn, repeat)
+        results[f"{name}_ms"] = round(elapsed * 1000, 3)
+        stdout.write(f"{name:>20}: {elapsed * 1000:8.3f} ms for {bars} bars")
+    return results
@@ -0,0 +1,121 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import copy
+import logging
+import logging.config
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmarks import benchmark_database
+from api.benchmarks.graphql import AUTOCOMPLETE_QUERY, CACHES, StubOBB
+
+
+def pipelines(directory: str) -> dict[str, dict]:
+    """
+    The logging configs compared: none, synchronous writes on the request thread (the former config) and the queue
+    with and without sampling (the current config).
+    """
+    current: dict = copy.deepcopy(settings.LOGGING)
+    current["handlers"]["file"]["filename"] = os.path.join(directory, "queue")
+    unsampled = copy.deepcopy(current)
+    unsampled["handlers"]["file"]["filename"] = os.path.join(directory, "unsampled")
+    unsampled["filters"]["sampling"]["rates"] = {}
+    synchronous = copy.deepcopy(current)
+    synchronous["handlers"]["file"].update(filename=os.path.join(directory, "sync"), formatter="verbose")
+    del synchronous["handlers"]["queue"]
+    synchronous["loggers"]["django"]["handlers"] = ["file", "console"]
+    return {
+        "none": {"version": 1, "disable_existing_loggers": False, "loggers": {"django": {"level": "WARNING"}}},
+        "sync": synchronous,
+        "queue_unsampled": unsampled,
+        "queue": current,
+    }
+
+
+class LoggingOBB(StubOBB):
+    """Logs like DEBUG SQL logging does, `records` debug records per request."""
+
+    def __init__(self, records: int):
+        super().__init__({}, [])
+        self.records = records
+        self.equity.search = self.search
+
+    def search(self, query):
+        logger = logging.getLogger("django.db.backends")
+        for i in range(self.records):
+            logger.debug("(0.000) SELECT * FROM api_bar WHERE symbol = %s; args=%s", query, (query, i))
+        return SimpleNamespace(results=[{"symbol": query, "name": "Company", "cik": "1"}])
+
+
+def add_arguments(parser):
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per client")
+    parser.add_argument("--records", type=int, default=50, help="DEBUG records logged per request")
+
+
+def run(stdout, threads=8, requests=100, records=50, **options) -> dict:
+    results: dict = {"params": {"threads": threads, "requests": requests, "records": records}}
+    with (
+        benchmark_database(),
+        tempfile.TemporaryDirectory() as directory,
+        override_settings(CACHES=CACHES, ALLOWED_HOSTS=["testserver"]),
+        patch("api.schema.obb", LoggingOBB(records)),
+    ):
+        user = User.objects.create_user(username="benchmark")
+        authorization = f"Bearer {AccessToken.for_user(user)}"
+        body = {"query": AUTOCOMPLETE_QUERY, "variables": {"query": "SYM"}}
+        url = reverse("graphql")
+
+        def client(_):
+            latencies = []
+            http = Client(HTTP_AUTHORIZATION=authorization)
+            try:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    http.post(url, body, content_type="application/json")
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+            return latencies
+
+        Client(HTTP_AUTHORIZATION=authorization).post(
+            url, body, content_type="application/json"
+        )  # Import and warm the schema first
+        try:
+            for name, config in pipelines(directory).items():
+                logging.config.dictConfig(config)
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    latencies = sorted(sum(executor.map(client, range(threads)), []))
+                elapsed = time.perf_counter() - start
+                p50 = statistics.median(latencies)
+                p99 = latencies[int(len(latencies) * 0.99) - 1]
+                queue = logging._handlers.get("queue")  # type: ignore[attr-defined]
+                dropped = f", {queue.dropped} records dropped" if queue else ""
+                stdout.write(
+                    f"{name:>16}: p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, "
+                    f"{len(latencies) / elapsed:,.0f} requests/s{dropped}"
+                )
+                results[f"{name}.p50_ms"] = round(p50 * 1000, 3)
+                results[f"{name}.p99_ms"] = round(p99 * 1000, 3)
+        finally:
+            logging.config.dictConfig(settings.LOGGING)
+    return results
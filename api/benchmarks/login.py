@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+
+from allauth.account.models import EmailAddress
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from api.benchmarks import benchmark_database
+from api.serializers import CustomTokenObtainPairSerializer
+
+# Hashing a password on purpose takes far longer than the queries around it, a fast hasher leaves those to measure
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+PASSWORD = "benchmark-password"
+
+
+class QueryCounter:
+    # Unlike CaptureQueriesContext, not reset by the request_started signal of each request
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--logins", type=int, default=300, help="Logins per flow")
+
+
+def rest_auth_login(client, email, password=PASSWORD):
+    response = client.post(reverse("rest_login"), {"email": email, "password": password})
+    if response.status_code != (200 if password == PASSWORD else 400):
+        raise Exception(f"Unexpected login response {response.status_code}: {response.content[:200]}")
+
+
+def token_login(client, email, password=PASSWORD):
+    serializer = CustomTokenObtainPairSerializer(data={"username": email, "password": password})
+    if not serializer.is_valid():
+        raise Exception(f"Unexpected token response: {serializer.errors}")
+
+
+def run(stdout, users=1000, logins=300, **options) -> dict:
+    results: dict = {"params": {"users": users, "logins": logins}}
+    with benchmark_database(), override_settings(PASSWORD_HASHERS=FAST_HASHERS, ALLOWED_HOSTS=["testserver"]):
+        password = make_password(PASSWORD)
+        accounts = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com", password=password) for i in range(users)
+        )
+        EmailAddress.objects.bulk_create(
+            EmailAddress(user=user, email=user.email, primary=True, verified=True) for user in accounts
+        )
+        emails = [user.email for user in accounts]
+        client = Client()
+        flows = {
+            "rest_auth": lambda email: rest_auth_login(client, email),
+            "rest_auth.failed": lambda email: rest_auth_login(client, email, "wrong-password"),
+            "token": lambda email: token_login(client, email),
+        }
+        for flow, login in flows.items():
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                login(emails[0])
+            start = time.perf_counter()
+            for i in range(logins):
+                login(emails[i % users])
+            elapsed = time.perf_counter() - start
+            stdout.write(f"{flow:>16}: {queries.count} queries per login, {logins / elapsed:.0f} logins/s")
+            results[f"{flow}.queries"] = queries.count
+            results[f"{flow}.ms_per_login"] = round(elapsed / logins * 1000, 3)
+    return results
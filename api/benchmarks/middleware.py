@@ -0,0 +1,60 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmarks import benchmark_database
+from api.benchmarks.login import QueryCounter
+
+# The cheapest query there is, so what is left is the cost of the request around it
+QUERY = {"query": "{ __typename }"}
+STACKS = {
+    # Every path through the session, locale, CSRF, authentication and message middleware, as before
+    "full": [],
+    "stateless": ["/graphql/"],
+}
+
+
+def add_arguments(parser):
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per stack and client")
+
+
+def run(stdout, requests=2000, **options) -> dict:
+    results: dict = {"params": {"requests": requests}}
+    with benchmark_database(), override_settings(ALLOWED_HOSTS=["testserver"]):
+        user = User.objects.create_user(username="benchmark")
+        token = f"Bearer {AccessToken.for_user(user)}"
+        # A browser that also signed in to the admin or through allauth sends its session cookie along
+        session_client = Client(HTTP_AUTHORIZATION=token)
+        session_client.force_login(user)
+        clients = {"token": Client(HTTP_AUTHORIZATION=token), "session_cookie": session_client}
+        url = reverse("graphql")
+        for stack, paths in STACKS.items():
+            with override_settings(API_STATELESS_PATHS=paths):
+                for name, client in clients.items():
+                    post = lambda: client.post(url, QUERY, content_type="application/json")  # noqa: E731
+                    queries = QueryCounter()
+                    with connection.execute_wrapper(queries):
+                        post()
+                    start = time.perf_counter()
+                    for _ in range(requests):
+                        post()
+                    elapsed = time.perf_counter() - start
+                    stdout.write(
+                        f"{stack:>9} {name:>14}: {elapsed / requests * 1e6:.0f} us per request, "
+                        f"{queries.count} queries"
+                    )
+                    results[f"{stack}.{name}.us_per_request"] = round(elapsed / requests * 1e6, 1)
+                    results[f"{stack}.{name}.queries"] = queries.count
+    return results
@@ -0,0 +1,46 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+from api.benchmarks import median_time, synthetic_ohlcv
+from api.expressions import compile_expression, compile_tokens, matches
+
+EXPRESSION = (
+    "close > ema(close, 20) and squeeze_on or crosses_above(ema(close, 9), ema(close, 21)) and rsi(close, 14) < 70"
+)
+
+
+def add_arguments(parser):
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--bars", type=int, default=300, help="Daily bars per symbol")
+    parser.add_argument("--expression", default=EXPRESSION)
+    parser.add_argument("--repeat", type=int, default=3)
+
+
+def run(stdout, symbols=2000, bars=300, expression=EXPRESSION, repeat=3, **options) -> dict:
+    frames = [synthetic_ohlcv(bars, seed=i) for i in range(symbols)]
+
+    def compile_cold():
+        compile_tokens.cache_clear()
+        compile_expression(expression)
+
+    compile_ms = median_time(compile_cold, repeat * 10) * 1000
+    compiled_ms = median_time(lambda: compile_expression(expression), repeat * 10) * 1000
+    plan = compile_expression(expression)
+    scan = median_time(lambda: sum(matches(plan, df) for df in frames), repeat)
+    matched = sum(matches(plan, df) for df in frames)
+    stdout.write(f"compile {compile_ms:.3f} ms, cached {compiled_ms:.4f} ms")
+    stdout.write(
+        f"scan of {symbols} symbols x {bars} bars: {scan * 1000:.1f} ms ({scan / symbols * 1e6:.0f} us per symbol), "
+        f"{matched} matched"
+    )
+    return {
+        "params": {"symbols": symbols, "bars": bars, "expression": expression},
+        "compile_ms": round(compile_ms, 4),
+        "compile_cached_ms": round(compiled_ms, 5),
+        "scan_ms": round(scan * 1000, 2),
+        "scan_us_per_symbol": round(scan / symbols * 1e6, 1),
+    }
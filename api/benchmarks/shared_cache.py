@@ -0,0 +1,88 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+from api.benchmarks import median_time, synthetic_ohlcv
+from api.series import CompactFrame
+from api.shared_cache import SharedMemoryCache
+
+BACKENDS = {"filebased": FileBasedCache, "shared": SharedMemoryCache}
+
+
+def add_arguments(parser):
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--bars", type=int, default=5000, help="Daily bars per symbol")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Worker counts to compare")
+    parser.add_argument("--repeat", type=int, default=20)
+
+
+def memory() -> dict[str, int]:
+    """Resident and private (only mapped by this process) bytes, from /proc (Linux only)."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                values[name] = int(rest.split()[0]) * 1024
+    return {"rss": values["Rss"], "private": values["Private_Clean"] + values["Private_Dirty"]}
+
+
+def worker(cache, keys, loaded, measure, results):
+    before = memory()
+    # Held like a worker holds what it serves, and read through so every page is touched
+    held = [cache.get(key) for key in keys]
+    checksum = sum(float(value.columns["close"].sum()) for value in held)
+    # Measured once every worker holds its values, pages mapped by several workers are only then shared
+    loaded.wait()
+    after = memory()
+    results.put({name: after[name] - before[name] for name in after} | {"checksum": checksum})
+    measure.wait()
+
+
+def run(stdout, symbols=200, bars=5000, workers=(1, 2, 4, 8), repeat=20, **options) -> dict:
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        raise Exception("Measuring worker memory needs /proc/self/smaps_rollup (Linux)")
+    frames = {f"history:1d:SYM{i}": CompactFrame.from_frame(synthetic_ohlcv(bars, seed=i)) for i in range(symbols)}
+    data_bytes = sum(frame.nbytes for frame in frames.values())
+    stdout.write(f"{symbols} symbols of {bars} bars, {data_bytes / 2**20:.1f} MiB of compact series")
+    results: dict = {"params": {"symbols": symbols, "bars": bars, "workers": list(workers)}}
+    context = multiprocessing.get_context("fork")
+
+    for name, backend in BACKENDS.items():
+        with tempfile.TemporaryDirectory() as directory:
+            cache = backend(directory, {"TIMEOUT": None, "OPTIONS": {"MAX_ENTRIES": symbols * 2}})
+            for key, frame in frames.items():
+                cache.set(key, frame)
+            key = next(iter(frames))
+            get = median_time(lambda: cache.get(key), repeat)
+            results[f"{name}.get_ms"] = round(get * 1000, 4)
+
+            for count in workers:
+                loaded, measured, queue = context.Barrier(count), context.Barrier(count + 1), context.Queue()
+                processes = [
+                    context.Process(target=worker, args=(cache, list(frames), loaded, measured, queue))
+                    for _ in range(count)
+                ]
+                for process in processes:
+                    process.start()
+                measurements = [queue.get() for _ in processes]
+                measured.wait()
+                for process in processes:
+                    process.join()
+                private = sum(m["private"] for m in measurements) / 2**20
+                rss = max(m["rss"] for m in measurements) / 2**20
+                stdout.write(
+                    f"{name:>10} x{count}: private {private:7.1f} MiB in total, rss {rss:6.1f} MiB per worker "
+                    f"(get {get * 1000:.3f} ms)"
+                )
+                results[f"{name}.{count}_workers.private_mib"] = round(private, 2)
+    return results
@@ -0,0 +1,116 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import threading
+import time
+from unittest.mock import patch
+
+from django.db import OperationalError, connection, transaction
+from django.test.utils import override_settings
+
+from api import sqlite
+from api.benchmarks import benchmark_database, median_time
+from api.models import Bar
+
+# What a database gets without any tuning, the rollback journal and an fsync on every commit
+ROLLBACK_JOURNAL = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+def add_arguments(parser):
+    parser.add_argument("--writers", type=int, default=4, help="Threads writing a small transaction at a time")
+    parser.add_argument("--readers", type=int, default=4, help="Threads reading a range of rows at a time")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration of each profile's run")
+
+
+def write(worker: int, n: int):
+    # About the size of a registration or a session save
+    with transaction.atomic():
+        for i in range(3):
+            Bar.objects.create(
+                symbol=f"W{worker}", interval="1d", ts=n * 3 + i, open=1, high=1, low=1, close=1, volume=1
+            )
+
+
+def read(worker: int, n: int):
+    list(Bar.objects.filter(symbol=f"W{n % 4}", interval="1d", ts__gte=n % 100).order_by("ts")[:100])
+
+
+def worker_loop(operation, worker: int, stop: threading.Event, latencies: list, errors: list):
+    n = 0
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                operation(worker, n)
+                latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                errors.append(time.perf_counter() - start)  # "database is locked"
+            n += 1
+    finally:
+        connection.close()
+
+
+def run_profile(profile: str, writers: int, readers: int, seconds: float) -> dict:
+    stop = threading.Event()
+    latencies: dict = {"write": [], "read": []}
+    errors: dict = {"write": [], "read": []}
+    threads = [
+        threading.Thread(
+            target=worker_loop, args=(write, f"{profile[:8]}{i}", stop, latencies["write"], errors["write"])
+        )
+        for i in range(writers)
+    ] + [
+        # Reading what the writers write
+        threading.Thread(
+            target=worker_loop,
+            args=(read, f"{profile[:8]}{i % max(1, writers)}", stop, latencies["read"], errors["read"]),
+        )
+        for i in range(readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    results = {}
+    for kind in ["write", "read"]:
+        timings = sorted(latencies[kind]) or [0.0]
+        results[f"{kind}s_per_s"] = len(latencies[kind]) / seconds
+        results[f"{kind}_p95_ms"] = timings[int(len(timings) * 0.95)] * 1000
+        results[f"{kind}_errors"] = len(errors[kind])
+    return results
+
+
+def connect():
+    connection.close()
+    connection.ensure_connection()
+
+
+def run(stdout, writers=4, readers=4, seconds=3.0, **options) -> dict:
+    results: dict = {"params": {"writers": writers, "readers": readers, "seconds": seconds}}
+    profiles = {"rollback_journal": ROLLBACK_JOURNAL, "concurrent": sqlite.PROFILES["concurrent"]}
+    with benchmark_database(), patch.dict(sqlite.PROFILES, {"rollback_journal": ROLLBACK_JOURNAL}):
+        if connection.vendor != "sqlite":
+            stdout.write(f"The database is {connection.vendor}, not SQLite")
+            return results
+        for profile in profiles:
+            with override_settings(SQLITE_PROFILE=profile):
+                connect()
+                measured = run_profile(profile, writers, readers, seconds)
+                # What a request pays when its connection isn't kept (CONN_MAX_AGE=0)
+                measured["connect_ms"] = median_time(connect, 20) * 1000
+            stdout.write(
+                f"{profile:>16}: {measured['writes_per_s']:7.0f} writes/s (p95 {measured['write_p95_ms']:6.1f} ms, "
+                f"{measured['write_errors']} locked), {measured['reads_per_s']:7.0f} reads/s "
+                f"(p95 {measured['read_p95_ms']:6.1f} ms, {measured['read_errors']} locked), "
+                f"connect {measured['connect_ms']:.2f} ms"
+            )
+            for metric, value in measured.items():
+                results[f"{profile}.{metric}"] = round(value, 3)
+        connection.close()
+    return results
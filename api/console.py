@@ -0,0 +1,346 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+The command processor behind the console tray. A line such as `chart AAPL --interval 1W; scan "squeeze_on" AAPL MSFT`
+is parsed once into `Invocation`s (cached by line), each is dispatched to the `ConsoleCommand` plugin of its name, and
+the commands of a line run concurrently, each with its own timeout. Plugins yield their results a chunk at a time and
+`execute` streams them back as events tagged with the index of their command, in the order they are produced:
+
+    {"command": 0, "type": "start", "name": "chart", "text": "chart AAPL --interval 1W"}
+    {"command": 0, "type": "table", "format": "chart", "columns": ["time", "open", "high", "low", "close", "volume"]}
+    {"command": 0, "type": "rows", "rows": [["2024-01-05", 181.99, ...], ...]}
+    {"command": 0, "type": "done", "seconds": 0.012}
+
+They are served as newline delimited JSON by POST /console/ and over a WebSocket at /console/ (see copilot/asgi.py).
+
+The built-in commands are below. Packages add their own with a "copilot.console" entry point, which is only imported
+the first time its command is run, e.g. in the package's pyproject.toml:
+
+    [tool.poetry.plugins."copilot.console"]
+    view = "copilot_plugin_view.console:View"
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from importlib.metadata import entry_points
+from typing import Iterator
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api import backtest
+from api.expressions import compile_expression, matches
+from api.instrumentation import registry
+from api.market_data import get_bars
+from api.plugins import PluginMount
+from api.resample import normalize_interval
+from api.schema import to_bar_time
+
+ENTRY_POINT_GROUP = "copilot.console"
+MAX_COMMANDS = 8
+CHUNK_ROWS = 500
+
+
+class ConsoleError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Invocation:
+    name: str
+    args: tuple[str, ...]
+    options: tuple[tuple[str, str], ...]
+    text: str
+
+    def option(self, name: str, default=None, type=str):
+        for key, value in self.options:
+            if key == name:
+                try:
+                    return type(value)
+                except ValueError:
+                    raise ConsoleError(f"Invalid --{name} '{value}'")
+        return default
+
+
+def parse_statement(tokens: list[str]) -> Invocation:
+    args: list[str] = []
+    options: list[tuple[str, str]] = []
+    remaining = iter(tokens[1:])
+    for token in remaining:
+        if not token.startswith("--") or len(token) == 2:
+            args.append(token)
+            continue
+        name, equals, value = token[2:].partition("=")
+        if not equals:
+            following = next(remaining, None)
+            if following is None:
+                raise ConsoleError(f"Option --{name} needs a value")
+            value = following
+        options.append((name, value))
+    return Invocation(tokens[0].lower(), tuple(args), tuple(options), shlex.join(tokens))
+
+
+@lru_cache(maxsize=1024)
+def parse(line: str) -> tuple[Invocation, ...]:
+    """The commands of a line, separated by unquoted semicolons, with `--name value` or `--name=value` options."""
+    lexer = shlex.shlex(line, posix=True, punctuation_chars=";")
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError as e:
+        raise ConsoleError(f"Invalid command: {e}")
+    statements: list[list[str]] = [[]]
+    for token in tokens:
+        if token.strip(";"):
+            statements[-1].append(token)
+        else:
+            statements.append([])
+    invocations = tuple(parse_statement(statement) for statement in statements if statement)
+    if not invocations:
+        raise ConsoleError("No command given, try 'help'")
+    if len(invocations) > MAX_COMMANDS:
+        raise ConsoleError(f"At most {MAX_COMMANDS} commands can be run at once")
+    return invocations
+
+
+class ConsoleCommand(metaclass=PluginMount):
+    name = ""
+    usage = ""
+    help = ""
+    # Seconds the command may take, settings.CONSOLE_COMMAND_TIMEOUT if not set
+    timeout: float | None = None
+
+    def run(self, invocation: Invocation, user) -> Iterator[dict]:
+        """Yields the result as events, e.g. `table(...)` and `rows(...)`, checked for cancellation between them."""
+        raise NotImplementedError
+
+
+def table(columns: list[str], format: str = "table") -> dict:
+    return {"type": "table", "format": format, "columns": columns}
+
+
+def rows(values: list[list]) -> Iterator[dict]:
+    for start in range(0, len(values), CHUNK_ROWS):
+        end = start + CHUNK_ROWS
+        yield {"type": "rows", "rows": values[start:end]}
+
+
+@lru_cache(maxsize=1)
+def registry_entries() -> dict:
+    """Commands by name, classes for the built-in ones and unloaded entry points for the installed packages' ones."""
+    commands: dict = {entry.name: entry for entry in entry_points(group=ENTRY_POINT_GROUP)}
+    commands.update((plugin.name, plugin) for plugin in ConsoleCommand.plugins if plugin.name)
+    return commands
+
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_command(name: str) -> ConsoleCommand:
+    entries = registry_entries()
+    with _lock:
+        found = entries.get(name)
+        if found is None:
+            raise ConsoleError(f"Unknown command '{name}', try 'help'")
+        if not isinstance(found, type):
+            try:
+                found = entries[name] = found.load()
+            except Exception as e:
+                raise ConsoleError(f"Unable to load the command '{name}': {e}")
+        if not issubclass(found, ConsoleCommand):
+            raise ConsoleError(f"The command '{name}' is not a ConsoleCommand")
+    return found()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CONSOLE_WORKERS, thread_name_prefix="console")
+        return _executor
+
+
+def produce(index: int, command: ConsoleCommand, invocation: Invocation, user, events, cancelled: threading.Event):
+    start = time.perf_counter()
+    outcome = "done"
+    try:
+        results = command.run(invocation, user)
+        try:
+            for event in results:
+                if cancelled.is_set():
+                    return
+                events.put({"command": index} | event)
+        finally:
+            getattr(results, "close", lambda: None)()
+        events.put({"command": index, "type": "done", "seconds": round(time.perf_counter() - start, 3)})
+    except Exception as e:
+        outcome = "error"
+        logging.warning(f"Console command '{invocation.text}' failed: {e}")
+        events.put({"command": index, "type": "error", "message": str(e)})
+    finally:
+        close_old_connections()
+        if not cancelled.is_set():
+            registry.inc("copilot_console_commands_total", command=invocation.name, outcome=outcome)
+
+
+def stream(invocations: tuple[Invocation, ...], commands: list[ConsoleCommand], user) -> Iterator[dict]:
+    events: queue.SimpleQueue = queue.SimpleQueue()
+    cancelled = [threading.Event() for _ in invocations]
+    deadlines = {}
+    try:
+        for index, (invocation, command) in enumerate(zip(invocations, commands)):
+            deadlines[index] = time.monotonic() + (command.timeout or settings.CONSOLE_COMMAND_TIMEOUT)
+            yield {"command": index, "type": "start", "name": invocation.name, "text": invocation.text}
+            _get_executor().submit(produce, index, command, invocation, user, events, cancelled[index])
+        while deadlines:
+            index = min(deadlines, key=deadlines.__getitem__)
+            try:
+                event = events.get(timeout=max(0.0, deadlines[index] - time.monotonic()))
+            except queue.Empty:
+                # The thread can't be interrupted, it stops at the next event its command yields
+                cancelled[index].set()
+                del deadlines[index]
+                registry.inc("copilot_console_commands_total", command=invocations[index].name, outcome="timeout")
+                yield {"command": index, "type": "timeout", "message": f"Timed out: {invocations[index].text}"}
+                continue
+            if event["command"] not in deadlines:
+                continue
+            if event["type"] in ("done", "error"):
+                del deadlines[event["command"]]
+            yield event
+    finally:
+        # Also when the client goes away mid-stream
+        for event in cancelled:
+            event.set()
+
+
+def execute(line: str, user=None) -> Iterator[dict]:
+    """Parses and resolves every command of the line up front, raising ConsoleError, then streams their events."""
+    if not isinstance(line, str):
+        raise ConsoleError('Expected {"command": "..."} with the command as a string')
+    invocations = parse(line)
+    commands = [get_command(invocation.name) for invocation in invocations]
+    return stream(invocations, commands, user)
+
+
+def token_user(raw_token: str):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token.encode()))
+    except AuthenticationFailed:
+        return None
+
+
+async def websocket(scope, receive, send):
+    """
+    ASGI WebSocket endpoint, authenticated by an access token in the `token` query parameter. Each message is a line,
+    `{"command": "chart AAPL"}`, answered with its events as they are produced.
+    """
+    if (await receive())["type"] != "websocket.connect":
+        return
+    token = parse_qs(scope.get("query_string", b"").decode()).get("token", [""])[0]
+    user = await sync_to_async(token_user)(token) if token else None
+    if not user:
+        await send({"type": "websocket.close", "code": 4401})
+        return
+    await send({"type": "websocket.accept"})
+    while True:
+        message = await receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        try:
+            events = execute(json.loads(message.get("text") or "{}")["command"], user)
+        except (ValueError, KeyError, TypeError) as e:
+            error = str(e) if isinstance(e, ConsoleError) else 'Expected {"command": "..."}'
+            await send({"type": "websocket.send", "text": json.dumps({"type": "error", "message": error})})
+            continue
+        while (event := await asyncio.to_thread(next, events, None)) is not None:
+            await send({"type": "websocket.send", "text": json.dumps(event, default=str)})
+
+
+class Help(ConsoleCommand):
+    name = "help"
+    usage = "help"
+    help = "List the commands"
+
+    def run(self, invocation, user):
+        yield table(["command", "usage", "help"])
+        commands = registry_entries()
+        yield from rows(
+            [
+                [name, command.usage, command.help] if isinstance(command, type) else [name, "", ""]
+                for name, command in sorted(commands.items())
+            ]
+        )
+
+
+class Chart(ConsoleCommand):
+    name = "chart"
+    usage = "chart SYMBOL [--interval 1d] [--bars 500]"
+    help = "Bars of a symbol, the most recent last"
+
+    def run(self, invocation, user):
+        if len(invocation.args) != 1:
+            raise ConsoleError(f"Usage: {self.usage}")
+        df = get_bars(invocation.args[0].upper(), normalize_interval(invocation.option("interval", "1d")))
+        df = df.tail(invocation.option("bars", 500, int))
+        yield table(["time", "open", "high", "low", "close", "volume"], format="chart")
+        times = [to_bar_time(timestamp).isoformat() for timestamp in df.index]
+        values = df[["open", "high", "low", "close", "volume"]].to_numpy().tolist()
+        yield from rows([[time, *row] for time, row in zip(times, values)])
+
+
+class Scan(ConsoleCommand):
+    name = "scan"
+    usage = "scan EXPRESSION SYMBOL... [--interval 1d] [--within 1]"
+    help = "Symbols matching an expression (see api/expressions.py), each as soon as it is checked"
+
+    def run(self, invocation, user):
+        if len(invocation.args) < 2:
+            raise ConsoleError(f"Usage: {self.usage}")
+        plan = compile_expression(invocation.args[0])
+        interval = normalize_interval(invocation.option("interval", "1d"))
+        within = invocation.option("within", 1, int)
+        yield table(["symbol"])
+        for symbol in dict.fromkeys(arg.upper() for arg in invocation.args[1:]):
+            if matches(plan, get_bars(symbol, interval), within):
+                yield {"type": "rows", "rows": [[symbol]]}
+
+
+class Backtest(ConsoleCommand):
+    name = "backtest"
+    usage = "backtest SYMBOL... [--entry ...] [--exit ...] [--side long] [--cost-bps 0] [--interval 1d]"
+    help = "Statistics of a strategy per symbol and for an equal weight portfolio (see api/backtest.py)"
+
+    def run(self, invocation, user):
+        if not invocation.args:
+            raise ConsoleError(f"Usage: {self.usage}")
+        strategy = backtest.Strategy(
+            invocation.option("entry", backtest.DEFAULT_ENTRY),
+            invocation.option("exit", backtest.DEFAULT_EXIT),
+            invocation.option("side", "long"),
+            invocation.option("cost-bps", 0.0, float),
+        )
+        interval = normalize_interval(invocation.option("interval", "1d"))
+        frames = {symbol: get_bars(symbol, interval) for symbol in dict.fromkeys(a.upper() for a in invocation.args)}
+        results, portfolio = backtest.run_many(frames, strategy)
+        stats = list(portfolio.stats)
+        yield table(["symbol"] + stats)
+        yield from rows([[symbol] + [result.stats[stat] for stat in stats] for symbol, result in results.items()])
+        yield from rows([["portfolio"] + [portfolio.stats[stat] for stat in stats]])
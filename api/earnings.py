@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+The market-wide earnings calendar as an index: its columns are arrays sorted by report date (then symbol), so the
+reports of a date range are two binary searches and a slice, however long the calendar is. The arrays are fixed width,
+so the cached index is unpickled as a few buffers rather than thousands of objects.
+"""
+
+from dataclasses import dataclass, fields
+from datetime import date
+from typing import TYPE_CHECKING
+
+from api.lazy import np, pd
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# The CSV columns of Alpha Vantage's EARNINGS_CALENDAR
+COLUMNS = ["symbol", "name", "reportDate", "fiscalDateEnding", "estimate", "currency"]
+
+
+@dataclass
+class EarningsCalendar:
+    report_dates: "np.ndarray"  # datetime64[D], ascending
+    symbols: "np.ndarray"
+    names: "np.ndarray"
+    fiscal_date_endings: "np.ndarray"  # datetime64[D], NaT when unknown
+    estimates: "np.ndarray"  # NaN when there is none
+    currencies: "np.ndarray"
+
+    @classmethod
+    def from_frame(cls, df: "DataFrame | None") -> "EarningsCalendar":
+        """From the CSV columns of Alpha Vantage's EARNINGS_CALENDAR, reports without a valid date are dropped."""
+        if df is None or df.empty:
+            df = pd.DataFrame(columns=COLUMNS)
+        report_dates = pd.to_datetime(df["reportDate"], errors="coerce").to_numpy("datetime64[D]")
+        symbols = df["symbol"].to_numpy(str)
+        valid = ~np.isnat(report_dates)
+        order = np.flatnonzero(valid)[np.lexsort((symbols[valid], report_dates[valid]))]
+        return cls(
+            report_dates[order],
+            symbols[order],
+            df["name"].to_numpy(str)[order],
+            pd.to_datetime(df["fiscalDateEnding"], errors="coerce").to_numpy("datetime64[D]")[order],
+            pd.to_numeric(df["estimate"], errors="coerce").to_numpy(float)[order],
+            df["currency"].to_numpy(str)[order],
+        )
+
+    @staticmethod
+    def is_calendar(df: "DataFrame") -> bool:
+        """Whether `df` has the calendar's columns, rather than those of an error such as a throttled call's JSON."""
+        return set(COLUMNS).issubset(df.columns)
+
+    def __len__(self) -> int:
+        return len(self.report_dates)
+
+    def take(self, positions) -> "EarningsCalendar":
+        return EarningsCalendar(*(getattr(self, column.name)[positions] for column in fields(self)))
+
+    def between(self, start: date, end: date, universe: list[str] | None = None) -> "EarningsCalendar":
+        """The reports from `start` to `end` (both included), only those of the `universe` symbols when given."""
+        low = np.searchsorted(self.report_dates, np.datetime64(start, "D"), side="left")
+        high = np.searchsorted(self.report_dates, np.datetime64(end, "D"), side="right")
+        reports = self.take(slice(low, max(low, high)))
+        if universe is not None:
+            reports = reports.take(np.isin(reports.symbols, [symbol.upper() for symbol in universe]))
+        return reports
+
+    def records(self) -> list[dict]:
+        """The reports as Python values, dates as datetimes and None for the missing ones."""
+        estimates = self.estimates.astype(object)
+        estimates[np.isnan(self.estimates)] = None
+        return [
+            {
+                "symbol": symbol,
+                "name": name,
+                "reportDate": report_date,
+                "fiscalDateEnding": fiscal_date_ending,
+                "estimate": estimate,
+                "currency": currency,
+            }
+            for symbol, name, report_date, fiscal_date_ending, estimate, currency in zip(
+                self.symbols.tolist(),
+                self.names.tolist(),
+                self.report_dates.astype("datetime64[us]").tolist(),
+                self.fiscal_date_endings.astype("datetime64[us]").tolist(),
+                estimates.tolist(),
+                self.currencies.tolist(),
+            )
+        ]
@@ -0,0 +1,208 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Bulk export of bars and indicators for many symbols, served by POST /export/:
+
+    {"symbols": ["AAPL", "MSFT"], "interval": "1d", "start": "2020-01-01", "end": "2024-12-31",
+     "indicators": [{"name": "rsi", "params": {"length": 14}}], "format": "csv"}
+
+The response is one table with a `symbol` and a `time` column, the bars and the indicator columns, streamed as CSV
+chunks or Parquet row groups (with pyarrow installed) of at most EXPORT_CHUNK_ROWS rows. Symbols are loaded and
+encoded one at a time, so the memory used is bounded by the largest symbol, not by the size of the export.
+"""
+
+import io
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import TYPE_CHECKING, Iterator
+
+from django.conf import settings
+
+from api import indicators as indicator_registry
+from api.indicators import OHLCV
+from api.instrumentation import registry
+from api.lazy import pd
+from api.market_data import get_bars
+from api.resample import normalize_interval, parse_interval
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+CONTENT_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+# Later releases need NumPy 2, the project is on NumPy 1 (see pyproject.toml)
+PYARROW_REQUIREMENT = "pyarrow>=17,<18"
+
+
+class ExportError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Export:
+    symbols: tuple[str, ...]
+    interval: str = "1d"
+    start: "pd.Timestamp | None" = None
+    # Inclusive, a date ends with its last bar
+    end: "pd.Timestamp | None" = None
+    indicators: tuple = field(default_factory=tuple)
+    format: str = "csv"
+
+    @classmethod
+    def from_request(cls, data: dict) -> "Export":
+        """From the JSON body of a request, raising ExportError for anything invalid before a byte is streamed."""
+        if not isinstance(data, dict):
+            raise ExportError('Expected {"symbols": [...], ...}')
+        symbols = data.get("symbols")
+        if isinstance(symbols, str):
+            symbols = symbols.split(",")
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ExportError('Expected "symbols" as a list of symbols')
+        symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+        if not symbols:
+            raise ExportError("No symbols to export")
+        if len(symbols) > settings.EXPORT_MAX_SYMBOLS:
+            raise ExportError(f"At most {settings.EXPORT_MAX_SYMBOLS} symbols can be exported at once")
+        export_format = data.get("format", "csv")
+        if export_format not in CONTENT_TYPES:
+            raise ExportError(f"Invalid format '{export_format}', one of {', '.join(CONTENT_TYPES)}")
+        try:
+            interval = normalize_interval(data.get("interval", "1d"))
+            indicators = tuple(indicator_registry.from_spec(dict(spec)) for spec in data.get("indicators") or [])
+            start, end = (pd.Timestamp(data[key]) if data.get(key) else None for key in ["start", "end"])
+        except (ValueError, TypeError) as e:
+            raise ExportError(str(e))
+        if start is not None and end is not None and end < start:
+            raise ExportError("The end is before the start")
+        if export_format == "parquet":
+            parquet()  # Fails up front without pyarrow
+        return cls(tuple(symbols), interval, start, end, indicators, export_format)
+
+    @property
+    def columns(self) -> list[str]:
+        return ["symbol", "time", *OHLCV, *(column for indicator in self.indicators for column in indicator.columns)]
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.format]
+
+    @property
+    def filename(self) -> str:
+        return f"bars-{self.interval}.{self.format}"
+
+    def frame(self, symbol: str) -> "DataFrame":
+        """The bars of a symbol in the range, with the indicators computed over all of its bars (so they are warm)."""
+        df = get_bars(symbol, self.interval)
+        if self.indicators:
+            df = df.copy()
+            indicator_registry.append(df, list(self.indicators))
+        if self.start is not None:
+            df = df[df.index >= self.start]
+        if self.end is not None and self.end == self.end.normalize():
+            df = df[df.index < self.end + timedelta(days=1)]  # A date includes all of its bars
+        elif self.end is not None:
+            df = df[df.index <= self.end]
+        return df
+
+    def chunks(self) -> Iterator["DataFrame"]:
+        """The rows of every symbol in the order requested, at most EXPORT_CHUNK_ROWS at a time."""
+        values = self.columns[2:]
+        size = max(1, settings.EXPORT_CHUNK_ROWS)
+        for symbol in self.symbols:
+            try:
+                df = self.frame(symbol)
+            except Exception as e:
+                # The response has started, a symbol that fails is left out of it
+                logging.warning(f"Unable to export '{symbol}': {e}")
+                continue
+            for offset in range(0, len(df), size):
+                end = offset + size
+                rows = df.iloc[offset:end]
+                chunk = rows.reindex(columns=values).astype("float64")
+                chunk.insert(0, "time", rows.index)
+                chunk.insert(0, "symbol", symbol)
+                yield chunk
+
+    @property
+    def time_format(self) -> str:
+        # Daily and longer bars as dates, as the GraphQL API reports them (see schema.to_bar_time)
+        return "%Y-%m-%dT%H:%M:%S" if parse_interval(self.interval)[1] in "mh" else "%Y-%m-%d"
+
+    def stream(self) -> Iterator[bytes]:
+        start = time.perf_counter()
+        rows = 0
+
+        def counted():
+            nonlocal rows
+            for chunk in self.chunks():
+                rows += len(chunk)
+                yield chunk
+
+        if self.format == "csv":
+            yield from csv_stream(counted(), self.columns, self.time_format)
+        else:
+            yield from parquet_stream(counted(), self.columns)
+        elapsed = time.perf_counter() - start
+        registry.inc("copilot_export_rows_total", rows, format=self.format)
+        logging.info(
+            f"Exported {rows} rows of {len(self.symbols)} symbols as {self.format} in {elapsed:.2f}s "
+            f"({rows / max(elapsed, 1e-9):.0f} rows/s)"
+        )
+
+
+def csv_stream(chunks: Iterator["DataFrame"], columns: list[str], time_format: str) -> Iterator[bytes]:
+    yield (",".join(columns) + "\n").encode()
+    for chunk in chunks:
+        chunk["time"] = chunk["time"].dt.strftime(time_format)
+        yield chunk.to_csv(index=False, header=False).encode()
+
+
+def parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError(f'Parquet exports need pyarrow installed (pip install "{PYARROW_REQUIREMENT}")')
+    return pyarrow, pyarrow.parquet
+
+
+class ChunkSink(io.RawIOBase):
+    """A write-only file that hands back what was written since the last `take`."""
+
+    def __init__(self):
+        super().__init__()
+        self.written = 0
+        self.pending: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.pending.append(bytes(data))
+        self.written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.written
+
+    def take(self) -> bytes:
+        data, self.pending = b"".join(self.pending), []
+        return data
+
+
+def parquet_stream(chunks: Iterator["DataFrame"], columns: list[str]) -> Iterator[bytes]:
+    pa, pq = parquet()
+    schema = pa.schema(
+        [("symbol", pa.string()), ("time", pa.timestamp("s"))] + [(column, pa.float64()) for column in columns[2:]]
+    )
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            # One row group per chunk, sent as soon as it is written
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.take()
+    yield sink.take()  # The footer
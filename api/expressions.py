@@ -0,0 +1,329 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+A small expression language for scans, alerts and custom indicators, in the spirit of thinkScript and Pine Script:
+
+    close > ema(close, 20) and squeeze_on
+    crosses_above(ema(close, 9), ema(close, 21)) or rsi(close, 14) < 30
+    (close - close[1]) / close[1] > 0.05
+
+An expression is parsed once into a plan of whole series operations, so evaluating it over thousands of bars costs a
+handful of NumPy calls rather than a Python walk per bar. Plans are cached by their tokens, identical subexpressions
+are evaluated once per plan, and indicator primitives of a column (`ema(close, 20)`, `atr(14)`) are read through the
+`indicators.Context` they are evaluated against, so they are shared with other expressions and indicators on the same
+frame.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable
+
+from api import indicators
+from api.lazy import np
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+TOKEN_PATTERN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|([A-Za-z_]\w*)|(<=|>=|==|!=|[-+*/<>()\[\],]))")
+KEYWORDS = {"and", "or", "not", "true", "false"}
+COMPARISONS = {"<", ">", "<=", ">=", "==", "!="}
+
+COLUMNS = set(indicators.OHLCV)
+# Series derived from the OHLCV columns, by name
+DERIVED = {
+    "hl2": lambda ctx: (ctx.values("high") + ctx.values("low")) / 2,
+    "hlc3": lambda ctx: (ctx.values("high") + ctx.values("low") + ctx.values("close")) / 3,
+    "ohlc4": lambda ctx: sum(ctx.values(name) for name in ["open", "high", "low", "close"]) / 4,
+    "tr": lambda ctx: ctx.true_range(),
+    "squeeze": lambda ctx: squeeze_column(ctx, "SQZ_20_2.0_20_1.5"),
+    "squeeze_on": lambda ctx: squeeze_column(ctx, "SQZ_ON"),
+    "squeeze_off": lambda ctx: squeeze_column(ctx, "SQZ_OFF"),
+}
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def squeeze_column(ctx: indicators.Context, column: str) -> "np.ndarray":
+    return indicators.Squeeze().compute(ctx)[column]
+
+
+def rolling(values: "np.ndarray", length: int, reduce) -> "np.ndarray":
+    if len(values) < length:
+        return np.full(len(values), np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(values, length)
+    return np.concatenate([np.full(length - 1, np.nan), reduce(windows, axis=1)])
+
+
+def crosses(a: "np.ndarray", b: "np.ndarray") -> "np.ndarray":
+    """Bars where `a` moved from at or below `b` to above it."""
+    difference = a - b
+    return (difference > 0) & (indicators.shift(difference, 1) <= 0)
+
+
+# Name -> (argument kinds, implementation), "s" is a series and "n" a length (a positive integer literal). Moving
+# averages and momentum of a plain column go through the context, see `Plan.call`
+FUNCTIONS: dict[str, tuple[str, Any]] = {
+    "sma": ("sn", indicators.sma),
+    "ema": ("sn", indicators.ema),
+    "rma": ("sn", indicators.rma),
+    "stdev": ("sn", indicators.stdev),
+    "mom": ("sn", indicators.shift_diff),
+    "rsi": ("sn", indicators.rsi),
+    "highest": ("sn", lambda values, length: rolling(values, length, np.max)),
+    "lowest": ("sn", lambda values, length: rolling(values, length, np.min)),
+    "sum": ("sn", lambda values, length: rolling(values, length, np.sum)),
+    "atr": ("n", None),
+    "abs": ("s", np.abs),
+    "min": ("ss", np.fmin),
+    "max": ("ss", np.fmax),
+    "crosses_above": ("ss", crosses),
+    "crosses_below": ("ss", lambda a, b: crosses(b, a)),
+}
+CONTEXT_FUNCTIONS = {"sma", "ema", "rma", "stdev", "mom"}
+
+BINARY: dict[str, Callable] = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": np.divide,
+    "<": np.less,
+    ">": np.greater,
+    "<=": np.less_equal,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+def tokenize(expression: str) -> tuple[str, ...]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise ExpressionError(f"Unexpected '{expression[position:].strip()[:10]}' at {position}")
+        tokens.append(match.group(match.lastindex or 0))
+        position = match.end()
+    return tuple(tokens)
+
+
+class Parser:
+    """
+    Recursive descent over the tokens, lowest precedence first: or, and, not, comparisons, + -, * /, unary minus and
+    `series[n]` (the value n bars ago). Nodes are tuples, so equal subexpressions are equal nodes.
+    """
+
+    def __init__(self, tokens: tuple[str, ...]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> str | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected: str | None = None) -> str:
+        token = self.peek()
+        if token is None or (expected is not None and token != expected):
+            raise ExpressionError(f"Expected '{expected or 'more'}' but found '{token or 'the end'}'")
+        self.position += 1
+        return token
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            raise ExpressionError("Empty expression")
+        node = self.logical("or", self.conjunction)
+        if self.peek() is not None:
+            raise ExpressionError(f"Unexpected '{self.peek()}'")
+        return node
+
+    def logical(self, keyword: str, operand) -> tuple:
+        node = operand()
+        while self.peek() == keyword:
+            self.take()
+            node = (keyword, node, operand())
+        return node
+
+    def conjunction(self) -> tuple:
+        return self.logical("and", self.negation)
+
+    def negation(self) -> tuple:
+        if self.peek() == "not":
+            self.take()
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self) -> tuple:
+        node = self.arithmetic()
+        if self.peek() in COMPARISONS:
+            operator = self.take()
+            node = ("op", operator, node, self.arithmetic())
+            if self.peek() in COMPARISONS:
+                raise ExpressionError("Comparisons cannot be chained, combine them with 'and'")
+        return node
+
+    def arithmetic(self) -> tuple:
+        node = self.term()
+        while self.peek() in ("+", "-"):
+            node = ("op", self.take(), node, self.term())
+        return node
+
+    def term(self) -> tuple:
+        node = self.unary()
+        while self.peek() in ("*", "/"):
+            node = ("op", self.take(), node, self.unary())
+        return node
+
+    def unary(self) -> tuple:
+        if self.peek() == "-":
+            self.take()
+            return ("op", "-", ("num", 0.0), self.unary())
+        node = self.primary()
+        while self.peek() == "[":
+            self.take()
+            node = ("shift", node, self.length("series[n]"))
+            self.take("]")
+        return node
+
+    def length(self, function: str) -> int:
+        token = self.take()
+        if not token.isdigit() or (function != "series[n]" and int(token) == 0):
+            raise ExpressionError(f"'{function}' needs a positive whole number of bars, not '{token}'")
+        return int(token)
+
+    def primary(self) -> tuple:
+        token = self.take()
+        if token == "(":
+            node = self.logical("or", self.conjunction)
+            self.take(")")
+            return node
+        if token[0].isdigit() or token[0] == ".":
+            return ("num", float(token))
+        if token in ("true", "false"):
+            return ("num", float(token == "true"))
+        if not (token[0].isalpha() or token[0] == "_") or token in KEYWORDS:
+            raise ExpressionError(f"Unexpected '{token}'")
+        if self.peek() == "(":
+            return self.call(token)
+        if token not in COLUMNS and token not in DERIVED:
+            raise ExpressionError(f"Unknown series '{token}', one of {', '.join(sorted(COLUMNS | set(DERIVED)))}")
+        return ("series", token)
+
+    def call(self, name: str) -> tuple:
+        if name not in FUNCTIONS:
+            raise ExpressionError(f"Unknown function '{name}', one of {', '.join(sorted(FUNCTIONS))}")
+        kinds = FUNCTIONS[name][0]
+        self.take("(")
+        arguments = []
+        for i, kind in enumerate(kinds):
+            if i:
+                self.take(",")
+            arguments.append(self.length(name) if kind == "n" else self.logical("or", self.conjunction))
+        if self.peek() != ")":
+            raise ExpressionError(f"'{name}' takes {len(kinds)} arguments")
+        self.take(")")
+        return ("call", name, *arguments)
+
+
+@dataclass(frozen=True)
+class Plan:
+    """
+    The distinct subexpressions of an expression in evaluation order, each step being (node, operand step indices).
+    """
+
+    expression: str
+    steps: tuple
+
+    def evaluate(self, ctx: indicators.Context) -> "np.ndarray":
+        results: list = []
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for node, operands in self.steps:
+                results.append(self.step(ctx, node, [results[i] for i in operands]))
+        return results[-1]
+
+    @staticmethod
+    def step(ctx: indicators.Context, node: tuple, operands: list):
+        kind = node[0]
+        if kind == "num":
+            return np.full(len(ctx.values("close")), node[1])
+        if kind == "series":
+            return ctx.values(node[1]) if node[1] in COLUMNS else DERIVED[node[1]](ctx)
+        if kind == "op":
+            return BINARY[node[1]](*operands).astype(np.float64)
+        if kind == "and":
+            return (truthy(operands[0]) & truthy(operands[1])).astype(np.float64)
+        if kind == "or":
+            return (truthy(operands[0]) | truthy(operands[1])).astype(np.float64)
+        if kind == "not":
+            return (~truthy(operands[0])).astype(np.float64)
+        if kind == "shift":
+            return indicators.shift(operands[0], node[2])
+        return Plan.call(ctx, node, operands)
+
+    @staticmethod
+    def call(ctx: indicators.Context, node: tuple, operands: list):
+        name, arguments = node[1], node[2:]
+        lengths = [argument for argument in arguments if isinstance(argument, int)]
+        if name == "atr":
+            return ctx.atr(lengths[0], "rma")
+        source = arguments[0]
+        if name in CONTEXT_FUNCTIONS and source[0] == "series" and source[1] in COLUMNS:
+            # Shared with every other user of the context, e.g. the Keltner Channel's EMA of the close
+            return getattr(ctx, name)(source[1], lengths[0])
+        return FUNCTIONS[name][1](*operands, *lengths).astype(np.float64)
+
+
+def truthy(values: "np.ndarray") -> "np.ndarray":
+    return (values != 0) & ~np.isnan(values)
+
+
+def plan(node: tuple, steps: dict) -> int:
+    """Add `node` and its operands to `steps` (node -> index, insertion ordered) once, returning its index."""
+    if node in steps:
+        return steps[node][0]
+    if node[0] == "call":
+        operands = [plan(argument, steps) for argument in node[2:] if isinstance(argument, tuple)]
+    elif node[0] in ("num", "series"):
+        operands = []
+    else:
+        operands = [plan(operand, steps) for operand in node[1:] if isinstance(operand, tuple)]
+    steps[node] = (len(steps), tuple(operands))
+    return steps[node][0]
+
+
+@lru_cache(maxsize=1024)
+def compile_tokens(tokens: tuple[str, ...]) -> Plan:
+    steps: dict = {}
+    try:
+        plan(Parser(tokens).parse(), steps)
+    except RecursionError:
+        # Parsing and planning recurse once per level of nesting (or per operator of a long chain)
+        raise ExpressionError("The expression is nested too deeply or too long")
+    return Plan(" ".join(tokens), tuple((node, operands) for node, (_, operands) in steps.items()))
+
+
+def compile_expression(expression: str) -> Plan:
+    """
+    Parse `expression` into a Plan, raising ExpressionError when it is invalid. Cached by tokens, so spacing does not
+    matter.
+    """
+    return compile_tokens(tokenize(expression))
+
+
+def evaluate(expression: "str | Plan", df: "DataFrame", ctx: indicators.Context | None = None) -> "np.ndarray":
+    """The value of an expression (or its compiled Plan) at every bar of an OHLCV frame, 1.0 and 0.0 for conditions."""
+    plan = expression if isinstance(expression, Plan) else compile_expression(expression)
+    return plan.evaluate(ctx or indicators.Context(df))
+
+
+def matches(expression: "str | Plan", df: "DataFrame", within: int = 1) -> bool:
+    """Whether a condition holds on any of the last `within` bars."""
+    if df.empty:
+        return False
+    values = evaluate(expression, df)
+    return bool(truthy(values[-within:]).any())
@@ -0,0 +1,417 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Vectorized technical indicators. Every `Indicator` subclass is registered by its `name` (see `PluginMount` in
+api/plugins.py), so adding an indicator is adding a class. Indicators are requested with specs,
+`{"name": "kc", "params": {"scalar": 1.0}}`, and computed against one `Context` per frame, which memoizes the moving
+averages, true range and momentum they are built from so that e.g. three Keltner Channels share one EMA of the close
+and one EMA of the true range.
+
+Results match pandas_ta (with talib disabled), the column names are formatted the same way: "KCLe_20_1.0".
+"""
+
+from typing import TYPE_CHECKING
+
+from api.lazy import np, pd
+from api.plugins import PluginMount
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+MA_MODES = ["sma", "ema", "rma"]
+OHLCV = ["open", "high", "low", "close", "volume"]
+
+
+class Context:
+    """The OHLCV columns of a frame and the intermediates computed from them, memoized by call."""
+
+    def __init__(self, df: "DataFrame"):
+        self.columns = {name: df[name].to_numpy(dtype=np.float64) for name in OHLCV}
+        self.memo: dict[tuple, "np.ndarray"] = {}
+        self.misses = 0
+
+    def values(self, source) -> "np.ndarray":
+        """A column by name, or an intermediate by its memo key, e.g. ("mom", "close", 12)."""
+        if isinstance(source, tuple):
+            return getattr(self, source[0])(*source[1:])
+        return self.columns[source]
+
+    def cached(self, key: tuple, compute) -> "np.ndarray":
+        if key not in self.memo:
+            self.misses += 1
+            self.memo[key] = compute()
+            self.memo[key].flags.writeable = False  # Shared by every indicator using it
+        return self.memo[key]
+
+    def sma(self, source, length: int) -> "np.ndarray":
+        return self.cached(("sma", source, length), lambda: sma(self.values(source), length))
+
+    def ema(self, source, length: int) -> "np.ndarray":
+        return self.cached(("ema", source, length), lambda: ema(self.values(source), length))
+
+    def rma(self, source, length: int) -> "np.ndarray":
+        return self.cached(("rma", source, length), lambda: rma(self.values(source), length))
+
+    def ma(self, mamode: str, source, length: int) -> "np.ndarray":
+        return getattr(self, mamode)(source, length)
+
+    def stdev(self, source, length: int) -> "np.ndarray":
+        return self.cached(("stdev", source, length), lambda: stdev(self.values(source), length))
+
+    def mom(self, source, length: int) -> "np.ndarray":
+        return self.cached(("mom", source, length), lambda: shift_diff(self.values(source), length))
+
+    def true_range(self) -> "np.ndarray":
+        return self.cached(
+            ("true_range",), lambda: true_range(*[self.columns[name] for name in ["high", "low", "close"]])
+        )
+
+    def atr(self, length: int, mamode: str) -> "np.ndarray":
+        # Seeded with the SMA of the first `length` ranges (as TA Lib does), then smoothed
+        def compute():
+            return moving_average(mamode, presma(self.true_range(), length), length)
+
+        return self.cached(("atr", length, mamode), compute)
+
+
+def leading(values: "np.ndarray") -> int:
+    valid = np.flatnonzero(~np.isnan(values))
+    return int(valid[0]) if len(valid) else len(values)
+
+
+def sma(values: "np.ndarray", length: int) -> "np.ndarray":
+    if len(values) < length:
+        return np.full(len(values), np.nan)
+    return np.concatenate([np.full(length - 1, np.nan), np.convolve(values, np.ones(length) / length, mode="valid")])
+
+
+def ewm(values: "np.ndarray", alpha: float) -> "np.ndarray":
+    """
+    y[t] = alpha * x[t] + (1 - alpha) * y[t - 1] from the first valid value on, as pandas' `ewm(adjust=False)`.
+    Unrolled, y[j] = decay^j * (decay * y[-1] + alpha * cumsum(x[k] / decay^k)), vectorized over blocks short enough
+    for decay^-k not to overflow (a single block for the usual lengths and frames).
+    """
+    start = leading(values)
+    tail = values[start:]
+    decay = 1 - alpha
+    if np.isnan(tail).any():
+        # Gaps are carried over the way pandas does
+        return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    if decay == 0 or len(tail) < 2:
+        return values.astype(np.float64)
+    block = max(1, int(600 / -np.log(decay)))
+    result = np.full(len(values), np.nan)
+    smoothed = result[start:]  # A view, filled block by block
+    smoothed[0] = carry = tail[0]
+    for position in range(1, len(tail), block):
+        end = min(position + block, len(tail))
+        chunk = tail[position:end]
+        powers = decay ** np.arange(len(chunk))
+        smoothed[position:end] = powers * (decay * carry + alpha * np.cumsum(chunk / powers))
+        carry = smoothed[end - 1]
+    return result
+
+
+def presma(values: "np.ndarray", length: int) -> "np.ndarray":
+    """Replace the first `length` values (from the first valid one) by their mean, at the last of them."""
+    start = leading(values)
+    seeded = values.copy()
+    end = start + length
+    if end <= len(values):
+        last = end - 1
+        seeded[last] = np.nanmean(values[start:end])
+        seeded[start:last] = np.nan
+    return seeded
+
+
+def ema(values: "np.ndarray", length: int) -> "np.ndarray":
+    if len(values) - leading(values) < length:
+        return np.full(len(values), np.nan)
+    return ewm(presma(values, length), 2 / (length + 1))
+
+
+def rma(values: "np.ndarray", length: int) -> "np.ndarray":
+    if len(values) < length:
+        return np.full(len(values), np.nan)
+    return ewm(values, 1 / length)
+
+
+def moving_average(mamode: str, values: "np.ndarray", length: int) -> "np.ndarray":
+    return {"sma": sma, "ema": ema, "rma": rma}[mamode](values, length)
+
+
+def stdev(values: "np.ndarray", length: int) -> "np.ndarray":
+    # Population standard deviation (ddof=0), as Bollinger Bands use
+    if len(values) < length:
+        return np.full(len(values), np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(values, length)
+    return np.concatenate([np.full(length - 1, np.nan), windows.std(axis=1)])
+
+
+def shift(values: "np.ndarray", periods: int) -> "np.ndarray":
+    result = np.full(len(values), np.nan)
+    if periods < len(values):
+        result[periods:] = values[: len(values) - periods]
+    return result
+
+
+def shift_diff(values: "np.ndarray", periods: int) -> "np.ndarray":
+    return values - shift(values, periods)
+
+
+def rsi(values: "np.ndarray", length: int, mamode: str = "rma", change: "np.ndarray | None" = None) -> "np.ndarray":
+    change = shift_diff(values, 1) if change is None else change
+    gain = moving_average(mamode, np.clip(change, 0, None), length)
+    loss = moving_average(mamode, np.clip(-change, 0, None), length)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100 * gain / (gain + loss)
+
+
+def true_range(high: "np.ndarray", low: "np.ndarray", close: "np.ndarray") -> "np.ndarray":
+    previous = shift(close, 1)
+    # fmax ignores the missing previous close of the first bar, which leaves its high - low range
+    return np.fmax(np.fmax(high - low, np.abs(high - previous)), np.abs(previous - low))
+
+
+class Indicator(metaclass=PluginMount):
+    """
+    An indicator and its parameters. Subclasses set `name`, the `defaults` of their parameters (a parameter's type is
+    that of its default) and implement `compute`.
+    """
+
+    name = ""
+    defaults: dict = {}
+
+    def __init__(self, **params):
+        unknown = sorted(set(params) - set(self.defaults))
+        if unknown:
+            raise ValueError(f"Unknown parameters for indicator '{self.name}': {', '.join(unknown)}")
+        self.params = {}
+        for key, default in self.defaults.items():
+            value = params.get(key, default)
+            try:
+                self.params[key] = type(default)(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for '{self.name}' parameter '{key}': {value!r}")
+            # Integer parameters are all lengths (in bars)
+            if isinstance(default, int) and self.params[key] < 1:
+                raise ValueError(f"'{self.name}' parameter '{key}' must be positive")
+        if self.params.get("mamode", "sma") not in MA_MODES:
+            raise ValueError(f"Invalid mamode '{self.params['mamode']}', one of {', '.join(MA_MODES)}")
+
+    @property
+    def key(self) -> str:
+        """Canonical form of the spec, e.g. "kc(length=20,mamode=ema,scalar=1.0)"."""
+        return f"{self.name}({','.join(f'{key}={value}' for key, value in sorted(self.params.items()))})"
+
+    @property
+    def columns(self) -> list[str]:
+        # Computing against no bars costs nothing and names the columns exactly as `compute` does
+        return list(self.compute(Context(pd.DataFrame({name: [] for name in OHLCV}))))
+
+    def compute(self, ctx: Context) -> dict[str, "np.ndarray"]:
+        raise NotImplementedError
+
+
+class BollingerBands(Indicator):
+    name = "bbands"
+    defaults = {"length": 20, "std": 2.0, "mamode": "sma"}
+
+    def compute(self, ctx):
+        length, std, mamode = self.params["length"], self.params["std"], self.params["mamode"]
+        mid = ctx.ma(mamode, "close", length)
+        deviations = std * ctx.stdev("close", length)
+        lower, upper = mid - deviations, mid + deviations
+        props = f"_{length}_{std}"
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {
+                f"BBL{props}": lower,
+                f"BBM{props}": mid,
+                f"BBU{props}": upper,
+                f"BBB{props}": 100 * (upper - lower) / mid,
+                f"BBP{props}": (ctx.columns["close"] - lower) / (upper - lower),
+            }
+
+
+def keltner(ctx: Context, length: int, scalar: float, mamode: str) -> tuple:
+    basis = ctx.ma(mamode, "close", length)
+    band = ctx.ma(mamode, ("true_range",), length)
+    return basis - scalar * band, basis, basis + scalar * band
+
+
+class KeltnerChannels(Indicator):
+    name = "kc"
+    defaults = {"length": 20, "scalar": 2.0, "mamode": "ema"}
+
+    def compute(self, ctx):
+        length, scalar, mamode = self.params["length"], self.params["scalar"], self.params["mamode"]
+        lower, basis, upper = keltner(ctx, length, scalar, mamode)
+        props = f"{mamode[0]}_{length}_{scalar}"
+        return {f"KCL{props}": lower, f"KCB{props}": basis, f"KCU{props}": upper}
+
+
+class RelativeStrengthIndex(Indicator):
+    name = "rsi"
+    defaults = {"length": 14, "mamode": "rma"}
+
+    def compute(self, ctx):
+        length, mamode = self.params["length"], self.params["mamode"]
+        return {f"RSI_{length}": rsi(ctx.values("close"), length, mamode, change=ctx.mom("close", 1))}
+
+
+class MACD(Indicator):
+    name = "macd"
+    defaults = {"fast": 12, "slow": 26, "signal": 9}
+
+    def compute(self, ctx):
+        fast, slow, signal = self.params["fast"], self.params["slow"], self.params["signal"]
+        macd = ctx.ema("close", fast) - ctx.ema("close", slow)
+        signal_line = ema(macd, signal)
+        props = f"_{fast}_{slow}_{signal}"
+        return {f"MACD{props}": macd, f"MACDh{props}": macd - signal_line, f"MACDs{props}": signal_line}
+
+
+class AverageTrueRange(Indicator):
+    name = "atr"
+    defaults = {"length": 14, "mamode": "rma"}
+
+    def compute(self, ctx):
+        length, mamode = self.params["length"], self.params["mamode"]
+        return {f"ATR{mamode[0]}_{length}": ctx.atr(length, mamode)}
+
+
+def squeeze_momentum(ctx: Context, params: dict) -> "np.ndarray":
+    return ctx.ma(params["mamode"], ("mom", "close", params["mom_length"]), params["mom_smooth"])
+
+
+def bollinger(ctx: Context, params: dict) -> tuple:
+    mid = ctx.ma(params["mamode"], "close", params["bb_length"])
+    deviations = params["bb_std"] * ctx.stdev("close", params["bb_length"])
+    return mid - deviations, mid + deviations
+
+
+def inside(bb: tuple, kc: tuple) -> "np.ndarray":
+    # Comparisons with NaN (before enough bars) are False, no squeeze
+    return ((bb[0] > kc[0]) & (bb[1] < kc[2])).astype(np.int64)
+
+
+def outside(bb: tuple, kc: tuple) -> "np.ndarray":
+    return ((bb[0] < kc[0]) & (bb[1] > kc[2])).astype(np.int64)
+
+
+class Squeeze(Indicator):
+    """Bollinger Bands inside the Keltner Channel (SQZ_ON) and the smoothed momentum, as charted."""
+
+    name = "squeeze"
+    defaults = {
+        "bb_length": 20,
+        "bb_std": 2.0,
+        "kc_length": 20,
+        "kc_scalar": 1.5,
+        "mom_length": 12,
+        "mom_smooth": 6,
+        "mamode": "sma",
+    }
+
+    def compute(self, ctx):
+        p = self.params
+        bb = bollinger(ctx, p)
+        kc = keltner(ctx, p["kc_length"], p["kc_scalar"], p["mamode"])
+        on, off = inside(bb, kc), outside(bb, kc)
+        props = f"_{p['bb_length']}_{p['bb_std']}_{p['kc_length']}_{p['kc_scalar']}"
+        return {f"SQZ{props}": squeeze_momentum(ctx, p), "SQZ_ON": on, "SQZ_OFF": off, "SQZ_NO": (1 - on) * (1 - off)}
+
+
+class SqueezePro(Indicator):
+    """The squeeze against three Keltner Channels, the narrower the channel the tighter the squeeze."""
+
+    name = "squeeze_pro"
+    defaults = {
+        "bb_length": 20,
+        "bb_std": 2.0,
+        "kc_length": 20,
+        "kc_scalar_wide": 2.0,
+        "kc_scalar_normal": 1.5,
+        "kc_scalar_narrow": 1.0,
+        "mom_length": 12,
+        "mom_smooth": 6,
+        "mamode": "sma",
+    }
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        if not self.params["kc_scalar_wide"] > self.params["kc_scalar_normal"] > self.params["kc_scalar_narrow"]:
+            raise ValueError("'squeeze_pro' needs kc_scalar_wide > kc_scalar_normal > kc_scalar_narrow")
+
+    def compute(self, ctx):
+        p = self.params
+        bb = bollinger(ctx, p)
+        channels = {
+            width: keltner(ctx, p["kc_length"], p[f"kc_scalar_{width}"], p["mamode"])
+            for width in ["wide", "normal", "narrow"]
+        }
+        scalars = "_".join(str(p[f"kc_scalar_{width}"]) for width in channels)
+        props = f"_{p['bb_length']}_{p['bb_std']}_{p['kc_length']}_{scalars}"
+        columns = {f"SQZPRO{props}": squeeze_momentum(ctx, p)}
+        for width, kc in channels.items():
+            columns[f"SQZPRO_ON_{width.upper()}"] = inside(bb, kc)
+        off = outside(bb, channels["wide"])
+        columns["SQZPRO_OFF"] = off
+        columns["SQZPRO_NO"] = (1 - columns["SQZPRO_ON_WIDE"]) * (1 - off)
+        return columns
+
+
+class Expression(Indicator):
+    """A series computed from an expression, e.g. "close - ema(close, 20)", see api/expressions.py."""
+
+    name = "expr"
+    defaults = {"expression": ""}
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.plan  # Invalid expressions are rejected with the spec
+
+    @property
+    def plan(self):
+        from api.expressions import compile_expression
+
+        return compile_expression(self.params["expression"])
+
+    def compute(self, ctx):
+        return {self.params["expression"].strip(): self.plan.evaluate(ctx)}
+
+
+def registry() -> dict[str, type[Indicator]]:
+    return {plugin.name: plugin for plugin in Indicator.plugins}
+
+
+def from_spec(spec: dict) -> Indicator:
+    """An indicator from {"name": ..., "params": {...}}, raising ValueError for unknown names or parameters."""
+    plugin = registry().get(spec.get("name", ""))
+    if plugin is None:
+        raise ValueError(f"Unknown indicator '{spec.get('name')}', one of {', '.join(sorted(registry()))}")
+    return plugin(**(spec.get("params") or {}))
+
+
+def spec_key(indicators: list[Indicator]) -> str:
+    return ";".join(indicator.key for indicator in indicators)
+
+
+def append(df: "DataFrame", indicators: list[Indicator]):
+    """Compute `indicators` against one shared context and add their columns to `df`."""
+    ctx = Context(df)
+    for indicator in indicators:
+        for name, values in indicator.compute(ctx).items():
+            df[name] = values
+
+
+# What ChartData's `squeeze` and `kc` series are read from when a client does not ask for specific indicators
+DEFAULT_INDICATORS: list[dict] = [
+    {"name": "kc", "params": {"scalar": 1.0}},
+    {"name": "kc", "params": {"scalar": 2.0}},
+    {"name": "kc", "params": {"scalar": 3.0}},
+    {"name": "squeeze"},
+]
@@ -0,0 +1,212 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+HELP = {
+    "copilot_request_duration_seconds": "Time to produce a response, by URL name",
+    "copilot_stage_duration_seconds": "Time spent in each stage of a GraphQL resolver",
+    "copilot_cache_requests_total": "Market data cache lookups, by kind and hit or miss",
+    "copilot_cache_hit_ratio": "Share of market data cache lookups that were hits, by kind",
+    "copilot_upstream_requests_total": "Requests made to market data providers",
+    "copilot_upstream_errors_total": "Failed or invalid responses from market data providers",
+    "copilot_console_commands_total": "Console commands run, by command and outcome (done, error or timeout)",
+    "copilot_export_rows_total": "Rows streamed by bulk exports, by format",
+}
+
+# Stage timings of the request being handled, read back by ServerTimingMiddleware
+request_timings: ContextVar[list | None] = ContextVar("request_timings", default=None)
+
+
+def label_key(labels: dict) -> str:
+    return ",".join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+
+
+class Registry:
+    """
+    Counters and histograms of this process. Each gunicorn worker periodically writes its values to its own file in
+    settings.METRICS_DIR and the /metrics view sums the files of all workers.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters: dict[str, dict[str, float]] = {}
+        self.histograms: dict[str, dict[str, dict]] = {}
+        self.last_flush = 0.0
+
+    def _check_fork(self):
+        # A forked worker starts from zero instead of repeating what the master recorded
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self._check_fork()
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self._check_fork()
+            series = self.histograms.setdefault(name, {})
+            histogram = series.setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+            histogram["buckets"][bisect_left(BUCKETS, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            self._check_fork()
+            return json.loads(json.dumps({"counters": self.counters, "histograms": self.histograms}))
+
+    def flush(self, force: bool = False):
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.last_flush = now
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{os.getpid()}.json")
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.warning(f"Unable to write metrics: {e}")
+
+
+registry = Registry()
+
+
+@contextmanager
+def timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe("copilot_stage_duration_seconds", seconds, stage=stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, seconds))
+
+
+def server_timing(timings: list) -> str:
+    totals: dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Alive, as another user
+    return True
+
+
+def remove_worker(pid: int):
+    """Drop the file of a worker that exited, its counts leave the sums (which Prometheus takes as a counter reset)."""
+    try:
+        os.remove(os.path.join(settings.METRICS_DIR, f"{pid}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def collect() -> dict:
+    """Sum the snapshots of all live workers (and this process), removing the files of the ones that exited."""
+    registry.flush(force=True)
+    snapshots = []
+    if settings.METRICS_DIR:
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+            pid = os.path.basename(path).removesuffix(".json")
+            if pid.isdigit() and not is_alive(int(pid)):
+                # Otherwise it would count forever, and a worker reusing the pid would replace its counts with its own
+                remove_worker(int(pid))
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # A worker is replacing its file or it was removed
+    else:
+        snapshots.append(registry.snapshot())
+
+    merged: dict = {"counters": {}, "histograms": {}}
+    for snapshot in snapshots:
+        for name, series in snapshot["counters"].items():
+            for key, value in series.items():
+                merged_series = merged["counters"].setdefault(name, {})
+                merged_series[key] = merged_series.get(key, 0.0) + value
+        for name, series in snapshot["histograms"].items():
+            for key, histogram in series.items():
+                merged_histogram = (
+                    merged["histograms"]
+                    .setdefault(name, {})
+                    .setdefault(key, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+                )
+                merged_histogram["buckets"] = [a + b for a, b in zip(merged_histogram["buckets"], histogram["buckets"])]
+                merged_histogram["sum"] += histogram["sum"]
+                merged_histogram["count"] += histogram["count"]
+    return merged
+
+
+def render(metrics: dict) -> str:
+    """Prometheus text exposition format."""
+    lines = []
+    for name, series in sorted(metrics["counters"].items()):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+        lines += [f"{name}{{{key}}} {value:g}" for key, value in sorted(series.items())]
+
+    cache = metrics["counters"].get("copilot_cache_requests_total", {})
+    ratios: dict[str, list[float]] = {}
+    for key, value in cache.items():
+        labels = dict(label.split("=", 1) for label in key.split(","))
+        totals = ratios.setdefault(labels["kind"], [0.0, 0.0])
+        totals[0] += value if labels["result"] == '"hit"' else 0.0
+        totals[1] += value
+    if ratios:
+        lines += [
+            f"# HELP copilot_cache_hit_ratio {HELP['copilot_cache_hit_ratio']}",
+            "# TYPE copilot_cache_hit_ratio gauge",
+        ]
+        lines += [
+            f"copilot_cache_hit_ratio{{kind={kind}}} {hits / total:g}" for kind, (hits, total) in sorted(ratios.items())
+        ]
+
+    for name, series in sorted(metrics["histograms"].items()):
+        lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+        for key, histogram in sorted(series.items()):
+            prefix = f"{key}," if key else ""
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ["+Inf"], histogram["buckets"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{key}}} {histogram['sum']:g}")
+            lines.append(f"{name}_count{{{key}}} {histogram['count']}")
+    return "\n".join(lines) + "\n"
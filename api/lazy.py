@@ -0,0 +1,42 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import logging
+import time
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+from django.utils.functional import SimpleLazyObject
+
+# Heavy modules are only imported on first use, so Django startup and management commands do not pay for them
+# (importing openbb alone takes seconds). Under gunicorn they are imported once in the master by `preload()` instead,
+# see gunicorn.conf.py, and the forked workers share those pages copy-on-write.
+PRELOAD_MODULES = ["pandas", "numpy", "openbb", "api.schema"]
+
+if TYPE_CHECKING:
+    # The proxies stand in for the modules, so they are typed as them
+    import numpy as np
+    import pandas as pd
+
+    # Its routers are attached at runtime, openbb's own type does not know them
+    obb: Any
+else:
+    # Not a module level __getattr__, which `from api.lazy import pd` would call right away
+    pd = SimpleLazyObject(lambda: import_module("pandas"))
+    np = SimpleLazyObject(lambda: import_module("numpy"))
+    obb = SimpleLazyObject(lambda: import_module("openbb").obb)
+
+
+def preload(modules=None):
+    for module in modules or PRELOAD_MODULES:
+        start = time.perf_counter()
+        try:
+            import_module(module)
+        except ImportError as e:
+            logging.warning(f"Unable to preload '{module}': {e}")
+            continue
+        logging.info(f"Preloaded '{module}' in {time.perf_counter() - start:.3f}s")
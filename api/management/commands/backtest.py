@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api import backtest
+from api.management.commands.warm_market_data import (
+    get_index_constituents,
+    read_universe_file,
+)
+from api.market_data import get_bars
+from api.resample import normalize_interval
+
+STATS = ["total_return", "cagr", "sharpe", "max_drawdown", "exposure", "trades", "win_rate"]
+
+
+def load_bars(symbol: str, interval: str):
+    try:
+        return get_bars(symbol, interval)
+    finally:
+        close_old_connections()
+
+
+def parse_sweep(values: list[str]) -> dict[str, list]:
+    """["length=10,20,50"] -> {"length": [10, 20, 50]}"""
+    grid = {}
+    for value in values:
+        name, _, options = value.partition("=")
+        if not name or not options:
+            raise CommandError(f"Invalid --sweep '{value}', e.g. --sweep length=10,20,50")
+        grid[name.strip()] = [option.strip() for option in options.split(",")]
+    return grid
+
+
+class Command(BaseCommand):
+    help = "Backtest entry and exit conditions (see api/expressions.py) over a universe, or sweep their parameters"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="Symbols to backtest")
+        parser.add_argument("--file", help="File with symbols separated by whitespace, commas or newlines")
+        parser.add_argument("--index", help="Backtest the constituents of an index, e.g. sp500 or nasdaq (needs FMP)")
+        parser.add_argument("--interval", default="1d", help="Bar interval, e.g. 1d, 1W or 1h")
+        parser.add_argument("--entry", default=backtest.DEFAULT_ENTRY, help="Condition to enter on (next open)")
+        parser.add_argument("--exit", default=backtest.DEFAULT_EXIT, help="Condition to exit on (next open)")
+        parser.add_argument("--side", choices=list(backtest.SIDES), default="long")
+        parser.add_argument("--cost-bps", type=float, default=0.0, help="Costs per fill in basis points")
+        parser.add_argument(
+            "--sweep",
+            action="append",
+            default=[],
+            help="Values for a {placeholder} of --entry/--exit, e.g. --sweep length=10,20,50 (repeatable)",
+        )
+        parser.add_argument("--workers", type=int, default=None, help="Processes for a sweep (default: all CPUs)")
+        parser.add_argument("--concurrency", type=int, default=4, help="Symbols loaded at the same time")
+
+    def handle(self, *args, **options):
+        try:
+            strategy = backtest.Strategy(options["entry"], options["exit"], options["side"], options["cost_bps"])
+            interval = normalize_interval(options["interval"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        symbols = list(options["symbols"])
+        if options["file"]:
+            symbols += read_universe_file(options["file"])
+        if options["index"]:
+            symbols += get_index_constituents(options["index"])
+        universe = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+        if not universe:
+            raise CommandError("No symbols to backtest, pass symbols, --file or --index")
+
+        start = time.perf_counter()
+        frames = {}
+        concurrency = max(1, options["concurrency"])
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backtest") as executor:
+            # With one worker the bars are loaded inline, on this thread's connection
+            futures = {
+                symbol: executor.submit(load_bars, symbol, interval) if concurrency > 1 else None for symbol in universe
+            }
+            for symbol, future in futures.items():
+                try:
+                    frames[symbol] = future.result() if future else get_bars(symbol, interval)
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f"{symbol:<8} FAILED {e}"))
+        if not frames:
+            raise CommandError("No bars loaded for any symbol")
+        self.stderr.write(f"Loaded {len(frames)} symbols in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        try:
+            if options["sweep"]:
+                self.sweep(frames, strategy, parse_sweep(options["sweep"]), options["workers"])
+            else:
+                results, portfolio = backtest.run_many(frames, strategy)
+                self.write_table("symbol", [(symbol, result.stats) for symbol, result in results.items()])
+                self.write_table("", [("portfolio", portfolio.stats)])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stderr.write(f"Backtested in {time.perf_counter() - start:.2f}s")
+
+    def sweep(self, frames, strategy, grid, workers):
+        rows = backtest.sweep(frames, strategy, grid, workers)
+        rows.sort(key=lambda row: row[1]["sharpe"], reverse=True)
+        self.write_table("params", [(" ".join(f"{k}={v}" for k, v in params.items()), stats) for params, stats in rows])
+
+    def write_table(self, label: str, rows: list[tuple[str, dict]]):
+        width = max([len(label)] + [len(name) for name, _ in rows])
+        self.stdout.write(f"{label:<{width}} " + " ".join(f"{stat:>12}" for stat in STATS))
+        for name, stats in rows:
+            values = " ".join(f"{stats[stat]:>12d}" if stat == "trades" else f"{stats[stat]:>12.4f}" for stat in STATS)
+            self.stdout.write(f"{name:<{width}} {values}")
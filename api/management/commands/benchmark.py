@@ -0,0 +1,45 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import SUITES, compare, load_baseline, save_baseline
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark suite and diff the results against its committed baseline"
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="suite", required=True)
+        for name, module_path in SUITES.items():
+            subparser = subparsers.add_parser(name)
+            subparser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+            subparser.add_argument(
+                "--max-regression", type=float, help="Fail when a metric grows more than this percent"
+            )
+            import_module(module_path).add_arguments(subparser)
+
+    def handle(self, *args, **options):
+        suite = options["suite"]
+        results = import_module(SUITES[suite]).run(self.stdout, **options)
+
+        baseline = load_baseline(suite)
+        regressions = []
+        if baseline:
+            if baseline.get("params") != results.get("params"):
+                self.stdout.write(self.style.WARNING(f"Baseline parameters differ: {baseline.get('params')}"))
+            for metric, previous, current, change in compare(baseline, results):
+                self.stdout.write(f"{metric:>32}: {previous:12.4f} -> {current:12.4f} ({change:+.1f}%)")
+                if options["max_regression"] is not None and change > options["max_regression"]:
+                    regressions.append(metric)
+        if options["save_baseline"]:
+            save_baseline(suite, results)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline '{suite}'"))
+        if regressions:
+            raise CommandError(f"Regressed more than {options['max_regression']}%: {', '.join(regressions)}")
@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import compare, load_baseline, save_baseline
+from api.lazy import PRELOAD_MODULES
+
+base_dir = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", ".."))
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure(modules: list[str]) -> tuple[float, dict[str, float]]:
+    """Import the modules in a fresh interpreter, returning the total and per top-level package time in ms."""
+    script = (
+        "import importlib, django\n"
+        "django.setup()\n"
+        f"for module in {modules!r}:\n"
+        "    importlib.import_module(module)\n"
+    )
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "copilot.settings"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script], capture_output=True, text=True, env=env, cwd=base_dir
+    )
+    if result.returncode != 0:
+        raise CommandError(f"Importing {', '.join(modules)} failed:\n{result.stderr[-2000:]}")
+    packages: dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match and not match.group(3):  # Only top-level imports, the nested ones are in their cumulative time
+            packages[match.group(4).split(".")[0]] += int(match.group(2)) / 1000
+    return sum(packages.values()), dict(packages)
+
+
+class Command(BaseCommand):
+    help = "Report the import time of what a worker loads to serve its first GraphQL request"
+
+    def add_arguments(self, parser):
+        parser.add_argument("modules", nargs="*", help="Modules to import (default: the URL conf and GraphQL schema)")
+        parser.add_argument("--preload", action="store_true", help="Include the modules preloaded by gunicorn")
+        parser.add_argument("--runs", type=int, default=3, help="Report the fastest of this many runs")
+        parser.add_argument("--top", type=int, default=15, help="Number of packages to list")
+        parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+        parser.add_argument(
+            "--max-regression", type=float, help="Fail when the total grows more than this percent over the baseline"
+        )
+
+    def handle(self, *args, **options):
+        modules = options["modules"] or [settings.ROOT_URLCONF, settings.GRAPHENE["SCHEMA"].rsplit(".", 1)[0]]
+        baseline_name = "importtime"
+        if options["preload"]:
+            modules = modules + PRELOAD_MODULES
+            baseline_name = "importtime-preload"
+
+        total, packages = min((measure(modules) for _ in range(max(1, options["runs"]))), key=lambda run: run[0])
+        top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[: options["top"]]
+        for package, ms in top:
+            self.stdout.write(f"{ms:10.1f} ms  {package}")
+        self.stdout.write(f"{total:10.1f} ms  total ({', '.join(modules)})")
+
+        results = {"total": round(total, 1), **{f"import.{package}": round(ms, 1) for package, ms in top}}
+        baseline = load_baseline(baseline_name)
+        if baseline:
+            for metric, previous, current, change in compare(baseline, results):
+                self.stdout.write(f"{metric:>32}: {previous:10.1f} -> {current:10.1f} ms ({change:+.1f}%)")
+            limit = options["max_regression"]
+            if limit is not None and baseline.get("total") and total > baseline["total"] * (1 + limit / 100):
+                raise CommandError(f"Import time regressed more than {limit}% over the baseline")
+        if options["save_baseline"]:
+            save_baseline(baseline_name, results)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline '{baseline_name}'"))
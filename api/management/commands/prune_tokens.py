@@ -0,0 +1,74 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+from typing import Iterator
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+BLACKLIST_APP = "rest_framework_simplejwt.token_blacklist"
+
+
+def delete_in_batches(queryset: QuerySet, batch_size: int = 1000, pause: float = 0.0) -> Iterator[int]:
+    """
+    Deletes the rows of `queryset` a batch at a time, yielding how many each batch deleted. Batches are found by walking
+    the primary key index from where the last one ended, and each is deleted in a transaction of its own with `pause`
+    seconds in between, so writers (on SQLite, all of them) are never locked out for long.
+    """
+    model = queryset.model
+    last = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last is not None:
+            batch = batch.filter(pk__gt=last)
+        ids = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            # Also deletes what cascades from them, counted apart
+            _, deleted = model.objects.filter(pk__in=ids).delete()
+        yield deleted.get(model._meta.label, 0)
+        last = ids[-1]
+        if pause:
+            time.sleep(pause)
+
+
+class Command(BaseCommand):
+    help = "Delete expired JWTs from the outstanding and blacklisted token tables in small batches, e.g. from cron"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Tokens deleted per transaction")
+        parser.add_argument("--pause", type=float, default=0.05, help="Seconds between batches")
+
+    def handle(self, *args, **options):
+        if not apps.is_installed(BLACKLIST_APP):
+            self.stdout.write(f"{BLACKLIST_APP} is not installed, there are no token tables to prune")
+            return
+        OutstandingToken = apps.get_model("token_blacklist", "OutstandingToken")
+        BlacklistedToken = apps.get_model("token_blacklist", "BlacklistedToken")
+        self.write_sizes(OutstandingToken, BlacklistedToken)
+
+        start = time.perf_counter()
+        deleted = batches = 0
+        expired = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+        for count in delete_in_batches(expired, max(1, options["batch_size"]), options["pause"]):
+            deleted += count
+            batches += 1
+        elapsed = time.perf_counter() - start
+        # Pauses included, it is the rate the tables are pruned at
+        self.stdout.write(
+            f"Deleted {deleted} expired tokens in {batches} batches and {elapsed:.2f}s "
+            f"({deleted / elapsed if elapsed else 0:.0f} tokens/s)"
+        )
+        self.write_sizes(OutstandingToken, BlacklistedToken)
+
+    def write_sizes(self, *models):
+        self.stdout.write(", ".join(f"{model._meta.db_table}: {model.objects.count()} rows" for model in models))
@@ -0,0 +1,85 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.expressions import Plan, compile_expression, matches
+from api.management.commands.warm_market_data import (
+    get_index_constituents,
+    read_universe_file,
+)
+from api.market_data import get_bars
+from api.resample import normalize_interval
+
+
+def scan_symbol(expression: Plan, symbol: str, interval: str, within: int) -> tuple[str, bool, str | None]:
+    try:
+        return symbol, matches(expression, get_bars(symbol, interval), within), None
+    except Exception as e:
+        return symbol, False, str(e)
+
+
+def scan_in_thread(expression: Plan, symbol: str, interval: str, within: int) -> tuple[str, bool, str | None]:
+    try:
+        return scan_symbol(expression, symbol, interval, within)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'List the symbols of a universe matching an expression, e.g. "close > ema(close, 20) and squeeze_on"'
+
+    def add_arguments(self, parser):
+        parser.add_argument("expression", help="Condition to scan for, see api/expressions.py")
+        parser.add_argument("symbols", nargs="*", help="Symbols to scan")
+        parser.add_argument("--file", help="File with symbols separated by whitespace, commas or newlines")
+        parser.add_argument("--index", help="Scan the constituents of an index, e.g. sp500 or nasdaq (needs FMP)")
+        parser.add_argument("--interval", default="1d", help="Bar interval, e.g. 1d, 1W or 15m")
+        parser.add_argument(
+            "--within", type=int, default=1, help="Match when the condition held on any of the last N bars"
+        )
+        parser.add_argument("--concurrency", type=int, default=4, help="Symbols loaded at the same time")
+
+    def handle(self, *args, **options):
+        try:
+            expression = compile_expression(options["expression"])
+            interval = normalize_interval(options["interval"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        symbols = list(options["symbols"])
+        if options["file"]:
+            symbols += read_universe_file(options["file"])
+        if options["index"]:
+            symbols += get_index_constituents(options["index"])
+        universe = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+        if not universe:
+            raise CommandError("No symbols to scan, pass symbols, --file or --index")
+
+        start = time.perf_counter()
+        concurrency = max(1, options["concurrency"])
+        if concurrency == 1:
+            results = [scan_symbol(expression, symbol, interval, options["within"]) for symbol in universe]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="scan") as executor:
+                results = list(
+                    executor.map(
+                        lambda symbol: scan_in_thread(expression, symbol, interval, options["within"]), universe
+                    )
+                )
+
+        matched = [symbol for symbol, match, _ in results if match]
+        for symbol, _, error in results:
+            if error:
+                self.stderr.write(self.style.ERROR(f"{symbol:<8} FAILED {error}"))
+        for symbol in matched:
+            self.stdout.write(symbol)
+        # Only the matches go to stdout, so they can be piped
+        self.stderr.write(f"{len(matched)} of {len(universe)} symbols match in {time.perf_counter() - start:.1f}s")
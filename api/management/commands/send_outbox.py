@@ -0,0 +1,31 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Send the emails due in the outbox (see api/outbox.py), once or every EMAIL_OUTBOX_POLL_INTERVAL seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep sending, e.g. with EMAIL_OUTBOX_THREAD=False")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain()
+            if sent or failed or not options["loop"]:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed")
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(settings.EMAIL_OUTBOX_POLL_INTERVAL)
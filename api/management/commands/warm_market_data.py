@@ -0,0 +1,162 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api.lazy import obb
+from api.market_calendar import MARKET_TIMEZONE, is_trading_day, session_close
+from api.market_data import RateLimiter, get_history
+from api.models import WatchlistSymbol
+from api.schema import load_earnings, load_indicator_frame
+
+
+def read_universe_file(path: str) -> list[str]:
+    symbols: list[str] = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0]
+            symbols.extend(symbol for symbol in line.replace(",", " ").split())
+    return symbols
+
+
+def get_index_constituents(index: str) -> list[str]:
+    api_key = os.getenv("FMP_API_KEY")
+    if api_key:
+        obb.user.credentials.fmp_api_key = api_key
+    return [row.symbol for row in obb.index.constituents(index, provider="fmp").results]
+
+
+class Command(BaseCommand):
+    help = "Prefetch history, earnings and indicators for a universe of symbols (meant to run after market close)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("symbols", nargs="*", help="Symbols to warm")
+        parser.add_argument("--file", help="File with symbols separated by whitespace, commas or newlines")
+        parser.add_argument("--index", help="Warm the constituents of an index, e.g. sp500 or nasdaq (needs FMP)")
+        parser.add_argument("--watchlists", action="store_true", help="Warm the symbols on the users' watchlists")
+        parser.add_argument("--concurrency", type=int, default=4, help="Symbols warmed at the same time")
+        parser.add_argument(
+            "--quota",
+            type=float,
+            default=settings.MARKET_DATA_QUOTA_PER_MINUTE,
+            help="Upstream calls per minute across all threads (0 for unlimited)",
+        )
+        parser.add_argument(
+            "--state",
+            default=os.path.join(settings.MARKET_DATA_CACHE_DIR, "warm_market_data.json"),
+            help="Progress file, symbols already warmed for the current session are skipped on a re-run",
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignore the progress of an earlier run")
+
+    def get_universe(self, options) -> list[str]:
+        symbols = list(options["symbols"])
+        if options["file"]:
+            symbols += read_universe_file(options["file"])
+        if options["index"]:
+            symbols += get_index_constituents(options["index"])
+        if options["watchlists"]:
+            symbols += WatchlistSymbol.objects.values_list("symbol", flat=True).distinct()
+        # Keep the order, drop duplicates
+        return list(dict.fromkeys(symbol.strip().upper() for symbol in symbols if symbol.strip()))
+
+    def handle(self, *args, **options):
+        universe = self.get_universe(options)
+        if not universe:
+            raise CommandError("No symbols to warm, pass symbols, --file, --index or --watchlists")
+
+        now = datetime.now(MARKET_TIMEZONE)
+        if is_trading_day(now.date()) and now < session_close(now.date()):
+            self.stdout.write(self.style.WARNING("The market has not closed yet, today's bar is still changing"))
+
+        # Progress is keyed by the market session and the universe, so a re-run the same day resumes
+        session = now.date().isoformat()
+        universe_hash = hashlib.sha1(",".join(sorted(universe)).encode()).hexdigest()
+        state = self.load_state(options["state"])
+        if options["restart"] or state.get("session") != session or state.get("universe") != universe_hash:
+            state = {"session": session, "universe": universe_hash, "done": {}, "failed": {}}
+        todo = [symbol for symbol in universe if symbol not in state["done"]]
+        self.stdout.write(f"Warming {len(todo)} of {len(universe)} symbols ({len(universe) - len(todo)} already done)")
+
+        limiter = RateLimiter(options["quota"])
+        concurrency = max(1, options["concurrency"])
+        start = time.perf_counter()
+        if concurrency == 1:
+            results = (self.warm(symbol, limiter) for symbol in todo)
+            self.record(results, state, options["state"])
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warm") as executor:
+                futures = [executor.submit(self.warm_in_thread, symbol, limiter) for symbol in todo]
+                self.record((future.result() for future in as_completed(futures)), state, options["state"])
+
+        failed = [symbol for symbol in universe if symbol in state["failed"] and symbol not in state["done"]]
+        self.stdout.write(
+            f"Warmed {len(universe) - len(failed)} of {len(universe)} symbols in {time.perf_counter() - start:.1f}s"
+        )
+        if failed:
+            raise CommandError(f"Failed to warm {len(failed)} symbols: {', '.join(failed)}")
+
+    def warm(self, symbol: str, limiter: RateLimiter) -> tuple[str, dict, str | None]:
+        timings: dict[str, float] = {}
+        try:
+            for stage, load in [
+                ("history", lambda: get_history(symbol, refresh=True)),
+                ("earnings", lambda: load_earnings(symbol, refresh=True)),
+                ("indicators", lambda: load_indicator_frame(symbol, refresh=True)),
+            ]:
+                if stage != "indicators":  # Computed locally from the cached history
+                    limiter.acquire()
+                stage_start = time.perf_counter()
+                if load() is None:
+                    raise Exception(f"No {stage} returned")
+                timings[stage] = round(time.perf_counter() - stage_start, 3)
+            return symbol, timings, None
+        except Exception as e:
+            return symbol, timings, str(e)
+
+    def warm_in_thread(self, symbol: str, limiter: RateLimiter) -> tuple[str, dict, str | None]:
+        try:
+            return self.warm(symbol, limiter)
+        finally:
+            close_old_connections()
+
+    def record(self, results, state: dict, path: str):
+        for symbol, timings, error in results:
+            stages = " ".join(f"{stage}={seconds:.3f}s" for stage, seconds in timings.items())
+            if error:
+                state["failed"][symbol] = error
+                self.stdout.write(self.style.ERROR(f"{symbol:<8} FAILED {stages} {error}"))
+            else:
+                state["failed"].pop(symbol, None)
+                state["done"][symbol] = timings
+                self.stdout.write(f"{symbol:<8} ok {stages}")
+            self.save_state(path, state)
+
+    @staticmethod
+    def load_state(path: str) -> dict:
+        if not path or not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_state(path: str, state: dict):
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.realpath(path)), exist_ok=True)
+        # Written to a temporary file first, so an interrupted run never leaves a truncated state behind
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,142 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+
+def easter(year: int) -> date:
+    # Anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    j = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * j) // 451
+    month, day = divmod(h + j - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """The n-th (1 based, -1 for the last) `weekday` (0 is Monday) of a month."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day: date) -> date:
+    # Saturday holidays are observed on Friday, Sunday holidays on Monday
+    return day + timedelta(days={5: -1, 6: 1}.get(day.weekday(), 0))
+
+
+@lru_cache(maxsize=None)
+def holidays(year: int) -> frozenset[date]:
+    """NYSE full day closures."""
+    days = {
+        nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(date(year, 7, 4)),
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed(date(year, 12, 25)),
+    }
+    if year >= 2022:
+        days.add(observed(date(year, 6, 19)))  # Juneteenth
+    # A Saturday New Year's Day is not observed on the Friday before (the last trading day of the year)
+    if date(year, 1, 1).weekday() != 5:
+        days.add(observed(date(year, 1, 1)))
+    return frozenset(days)
+
+
+@lru_cache(maxsize=None)
+def early_closes(year: int) -> frozenset[date]:
+    """Sessions closing at 13:00."""
+    days = {nth_weekday(year, 11, 3, 4) + timedelta(days=1)}  # The day after Thanksgiving
+    for day in [date(year, 7, 3), date(year, 12, 24)]:
+        if is_trading_day(day):
+            days.add(day)
+    return frozenset(days)
+
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def session_close(day: date) -> datetime:
+    close = EARLY_CLOSE if day in early_closes(day.year) else MARKET_CLOSE
+    return datetime.combine(day, close, MARKET_TIMEZONE)
+
+
+def session_open(day: date) -> datetime:
+    return datetime.combine(day, MARKET_OPEN, MARKET_TIMEZONE)
+
+
+def next_trading_day(day: date) -> date:
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+
+def is_open(now: datetime) -> bool:
+    now = now.astimezone(MARKET_TIMEZONE)
+    return is_trading_day(now.date()) and session_open(now.date()) <= now < session_close(now.date())
+
+
+def interval_seconds(interval: str) -> int | None:
+    """Length of an intraday interval ("5m", "1h"), None for daily and longer intervals."""
+    match = re.fullmatch(r"(\d+)([mh])", interval)
+    if not match:
+        return None
+    return int(match.group(1)) * (60 if match.group(2) == "m" else 3600)
+
+
+def expires_at(interval: str, now: datetime | None = None) -> datetime:
+    """
+    When bars of `interval` fetched `now` may have changed: daily (and longer) bars at the next session close, intraday
+    bars when the current bar completes or, outside of a session, once the first bar of the next session completes.
+    Providers are given settings.MARKET_DATA_SETTLE_SECONDS after that to publish it.
+    """
+    now = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    settle = timedelta(seconds=settings.MARKET_DATA_SETTLE_SECONDS)
+    today = now.date()
+    step = interval_seconds(interval)
+
+    if step is None:
+        if is_trading_day(today) and now < session_close(today) + settle:
+            return session_close(today) + settle
+        return session_close(next_trading_day(today)) + settle
+
+    if is_trading_day(today) and session_close(today) <= now < session_close(today) + settle:
+        return session_close(today) + settle  # The last bar of the session may still be published
+    if is_open(now):
+        elapsed = (now - session_open(today)).total_seconds()
+        bar_end = session_open(today) + timedelta(seconds=(elapsed // step + 1) * step)
+        return min(bar_end, session_close(today)) + settle
+    day = today if is_trading_day(today) and now < session_open(today) else next_trading_day(today)
+    return min(session_open(day) + timedelta(seconds=step), session_close(day)) + settle
+
+
+def ttl(interval: str, now: datetime | None = None) -> int:
+    """Seconds until `expires_at`, for cache timeouts."""
+    now = (now or datetime.now(MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    return max(1, int((expires_at(interval, now) - now).total_seconds()))
@@ -0,0 +1,144 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from api.bars import ingest_bars
+from api.instrumentation import registry
+from api.market_calendar import ttl
+from api.providers import fetch_historical
+from api.resample import base_interval, normalize_interval, resample
+from api.series import compact, expand
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# Reloads of stale entries, one at a time per entry
+executor = ThreadPoolExecutor(max_workers=settings.MARKET_DATA_REVALIDATE_WORKERS, thread_name_prefix="revalidate")
+pending: set[str] = set()
+pending_lock = threading.Lock()
+# Set while an entry loads, so it is never built from stale entries it depends on (indicators from history)
+loading: ContextVar[bool] = ContextVar("loading", default=False)
+
+
+def get_cache():
+    # Shared by all workers and management commands such as warm_market_data, see settings.CACHES
+    return caches["market_data"]
+
+
+def cached(kind: str, key: str, loader, refresh: bool = False, timeout: int | None = None):
+    """
+    Read-through cache with stale-while-revalidate: an entry past its `timeout` is still returned (for up to
+    settings.MARKET_DATA_STALE_TTL) while a background thread reloads it. `None` results (failed loads) are not stored.
+    """
+    cache = get_cache()
+    cache_key = f"{kind}:{key}"
+    timeout = settings.MARKET_DATA_CACHE_TTL if timeout is None else timeout
+    if not refresh:
+        value = cache.get(cache_key)
+        result = "miss" if value is None else "hit"
+        if value is not None:
+            fresh_until = cache.get(f"{cache_key}:fresh")
+            if fresh_until is not None and fresh_until <= time.time():
+                if loading.get():
+                    value, result = None, "miss"
+                else:
+                    result = "stale"
+                    revalidate(cache_key, loader, timeout)
+        registry.inc("copilot_cache_requests_total", kind=kind, result=result)
+        if value is not None:
+            return value
+    value = load(loader)
+    if value is not None:
+        store(cache, cache_key, value, timeout)
+    return value
+
+
+def load(loader):
+    token = loading.set(True)
+    try:
+        return loader()
+    finally:
+        loading.reset(token)
+
+
+def store(cache, cache_key: str, value, timeout: int):
+    # Kept past its freshness so it can be served while it is revalidated
+    lifetime = timeout + settings.MARKET_DATA_STALE_TTL
+    cache.set(cache_key, value, lifetime)
+    cache.set(f"{cache_key}:fresh", time.time() + timeout, lifetime)
+
+
+def revalidate(cache_key: str, loader, timeout: int):
+    with pending_lock:
+        if cache_key in pending:
+            return
+        pending.add(cache_key)
+    executor.submit(reload, cache_key, loader, timeout)
+
+
+def reload(cache_key: str, loader, timeout: int):
+    cache = get_cache()
+    try:
+        # Best effort across workers, within this one `pending` already keeps it to one reload per entry
+        if cache.add(f"{cache_key}:revalidating", True, settings.MARKET_DATA_REVALIDATE_TIMEOUT):
+            try:
+                value = load(loader)
+                if value is not None:
+                    store(cache, cache_key, value, timeout)
+            finally:
+                cache.delete(f"{cache_key}:revalidating")
+    except Exception as e:
+        logging.warning(f"Unable to revalidate '{cache_key}': {e}")
+    finally:
+        with pending_lock:
+            pending.discard(cache_key)
+        close_old_connections()
+
+
+def get_history(symbol: str, interval: str = "1d", refresh: bool = False) -> "DataFrame":
+    def fetch():
+        df = fetch_historical(symbol, interval)
+        # Persisted so the "local" provider can still serve it when every upstream provider is down
+        ingest_bars(symbol, interval, df)
+        return compact(df)
+
+    # Fresh until the bars can have changed, see market_calendar.expires_at
+    return expand(cached("history", f"{interval}:{symbol}", fetch, refresh=refresh, timeout=ttl(interval)))
+
+
+def get_bars(symbol: str, interval: str = "1d", refresh: bool = False) -> "DataFrame":
+    """History in any interval, resampled from the one the providers are asked for (see `resample.base_interval`)."""
+    base = base_interval(interval)
+    df = get_history(symbol, base, refresh=refresh)
+    return df if normalize_interval(interval) == base else resample(df, interval)
+
+
+class RateLimiter:
+    """Spaces calls evenly to stay within an upstream quota, shared by all threads."""
+
+    def __init__(self, calls_per_minute: float):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute > 0 else 0.0
+        self.next_call = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if wait > 0:
+            time.sleep(wait)
@@ -6,11 +6,17 @@ See the LICENSE file in the root of this project for the full license text.
 """
 
 import logging
+import time
 
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
 from django.http import JsonResponse
+from django.middleware import csrf, locale
 from rest_framework import status
 
-from copilot import settings
+from api.instrumentation import registry, request_timings, server_timing
 
 # Thought this was neededd, but it turns out the JWT has the User ID and APIs should not work if not validated...
 # from django.http import JsonResponse
@@ -50,3 +56,66 @@ class JSONErrorMiddleware:
             error += " " + str(exception)
         logging.exception(error, exc_info=exception)
         return JsonResponse({"exceptions": error}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ServerTimingMiddleware:
+    """Reports the stage timings recorded by `instrumentation.timer` in a Server-Timing header and records metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings: list = []
+        token = request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        total = time.perf_counter() - start
+        timings.append(("total", total))
+        response["Server-Timing"] = server_timing(timings)
+        match = getattr(request, "resolver_match", None)
+        registry.observe("copilot_request_duration_seconds", total, view=match.url_name if match else "unresolved")
+        registry.flush()
+        return response
+
+
+def is_stateless(request) -> bool:
+    """Whether the request is to an API authenticated by its token alone, see settings.API_STATELESS_PATHS."""
+    return request.path_info.startswith(tuple(settings.API_STATELESS_PATHS))
+
+
+class StatefulMiddlewareMixin:
+    """
+    Skips a middleware that only the browser pages need (sessions, users from the session, messages, languages and
+    CSRF) for the stateless API paths. The subclasses keep Django's names, so the admin's checks still find them.
+    """
+
+    def __call__(self, request):
+        if is_stateless(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(StatefulMiddlewareMixin, sessions.SessionMiddleware):
+    pass
+
+
+class LocaleMiddleware(StatefulMiddlewareMixin, locale.LocaleMiddleware):
+    pass
+
+
+class CsrfViewMiddleware(StatefulMiddlewareMixin, csrf.CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if is_stateless(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class AuthenticationMiddleware(StatefulMiddlewareMixin, auth.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(StatefulMiddlewareMixin, messages.MessageMiddleware):
+    pass
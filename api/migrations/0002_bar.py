@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2024-09-16 10:12
+
+from django.db import migrations, models
+
+
+def enable_sqlite_wal(apps, schema_editor):
+    # WAL is persistent in the database file, it lets range reads run while bars are being ingested
+    if schema_editor.connection.vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+
+class Migration(migrations.Migration):
+
+    # The journal mode cannot be changed inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Bar",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("symbol", models.CharField(max_length=16)),
+                ("interval", models.CharField(max_length=8)),
+                ("ts", models.BigIntegerField(help_text="Bar open time in epoch seconds (UTC)")),
+                ("open", models.FloatField()),
+                ("high", models.FloatField()),
+                ("low", models.FloatField()),
+                ("close", models.FloatField()),
+                ("volume", models.FloatField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="bar",
+            constraint=models.UniqueConstraint(
+                fields=("symbol", "interval", "ts"), name="unique_bar_symbol_interval_ts"
+            ),
+        ),
+        migrations.RunPython(enable_sqlite_wal, migrations.RunPython.noop),
+    ]
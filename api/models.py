@@ -6,8 +6,67 @@ See the LICENSE file in the root of this project for the full license text.
 """
 
 from django.db import models
+from django.utils import timezone
 
 
 class UserPreferences(models.Model):
     user = models.OneToOneField("auth.User", on_delete=models.CASCADE, related_name="preferences")
     dark_mode = models.BooleanField(default=True)
+    # Named layouts of the chart, heat-map and grid views, as the UI saved them
+    layouts = models.JSONField(default=dict, blank=True)
+
+
+class Watchlist(models.Model):
+    user = models.ForeignKey("auth.User", on_delete=models.CASCADE, related_name="watchlists")
+    name = models.CharField(max_length=64)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position", "id"]
+        constraints = [models.UniqueConstraint(fields=["user", "name"], name="unique_watchlist_user_name")]
+
+    def __str__(self):
+        return self.name
+
+
+class WatchlistSymbol(models.Model):
+    watchlist = models.ForeignKey(Watchlist, on_delete=models.CASCADE, related_name="symbols")
+    symbol = models.CharField(max_length=16)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["position", "id"]
+        constraints = [
+            models.UniqueConstraint(fields=["watchlist", "symbol"], name="unique_watchlist_symbol"),
+        ]
+
+
+class Bar(models.Model):
+    symbol = models.CharField(max_length=16)
+    interval = models.CharField(max_length=8)
+    ts = models.BigIntegerField(help_text="Bar open time in epoch seconds (UTC)")
+    open = models.FloatField()
+    high = models.FloatField()
+    low = models.FloatField()
+    close = models.FloatField()
+    volume = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index for range reads, which always filter on symbol and interval and then a range of ts
+            models.UniqueConstraint(fields=["symbol", "interval", "ts"], name="unique_bar_symbol_interval_ts"),
+        ]
+
+
+class OutboundEmail(models.Model):
+    """An email waiting in the outbox (see api/outbox.py), deleted once it is sent."""
+
+    message = models.BinaryField(help_text="The pickled EmailMessage")
+    recipients = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["send_after"], name="outbound_email_send_after")]
@@ -0,0 +1,131 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+A transactional outbox for outbound email. `OutboxBackend` (the EMAIL_BACKEND) stores each message as an
+`OutboundEmail` in the caller's transaction, so a registration that rolls back sends nothing and no request waits on
+the SMTP server. When the transaction commits a sender thread of the process is woken, which sends the due emails in
+batches over one connection of EMAIL_OUTBOX_BACKEND (the SMTP backend) and retries failed ones with a backoff.
+`manage.py send_outbox` does the same from a separate process.
+"""
+
+import copy
+import logging
+import os
+import pickle
+import threading
+from contextlib import suppress
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from api.models import OutboundEmail
+
+
+class OutboxBackend(BaseEmailBackend):
+    def send_messages(self, email_messages) -> int:
+        emails = []
+        for message in email_messages:
+            message = copy.copy(message)
+            message.connection = None  # Set to this backend by EmailMessage.send
+            emails.append(OutboundEmail(message=pickle.dumps(message), recipients=", ".join(message.recipients())))
+        OutboundEmail.objects.bulk_create(emails)
+        transaction.on_commit(sender.wake)
+        return len(emails)
+
+
+def claim(now) -> list[OutboundEmail]:
+    """Due emails, leased so that the senders of other processes skip them until they are sent or the lease ends."""
+    due = OutboundEmail.objects.filter(send_after__lte=now, attempts__lt=settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+    lease = now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+    claimed = []
+    for email in due.order_by("send_after", "id")[: settings.EMAIL_OUTBOX_BATCH_SIZE]:
+        # Only one sender's update matches the send_after it read
+        if OutboundEmail.objects.filter(pk=email.pk, send_after=email.send_after).update(send_after=lease):
+            claimed.append(email)
+    return claimed
+
+
+def send_batch() -> tuple[int, int]:
+    """Sends a batch of due emails over one connection, returns how many were sent and how many failed."""
+    emails = claim(timezone.now())
+    if not emails:
+        return 0, 0
+    sent, failed = [], []
+    connection = get_connection(settings.EMAIL_OUTBOX_BACKEND)
+    try:
+        for email in emails:
+            try:
+                connection.open()  # Once, unless a failure closed it
+                connection.send_messages([pickle.loads(email.message)])
+                sent.append(email.pk)
+            except Exception as e:
+                email.attempts += 1
+                email.last_error = str(e)
+                delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+                email.send_after = timezone.now() + timedelta(seconds=delay)
+                failed.append(email)
+                give_up = email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+                logging.warning(
+                    f"Unable to send email to {email.recipients} (attempt {email.attempts}"
+                    f"{', giving up' if give_up else ''}): {e}"
+                )
+                # The connection may be broken, the next email opens a new one
+                with suppress(Exception):
+                    connection.close()
+    finally:
+        with suppress(Exception):
+            connection.close()
+        OutboundEmail.objects.filter(pk__in=sent).delete()
+        OutboundEmail.objects.bulk_update(failed, ["attempts", "last_error", "send_after"])
+    return len(sent), len(failed)
+
+
+def drain() -> tuple[int, int]:
+    """Sends batches until no email is due."""
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = send_batch()
+        if not batch_sent and not batch_failed:
+            return sent, failed
+        sent, failed = sent + batch_sent, failed + batch_failed
+
+
+class Sender:
+    """Drains the outbox in a thread of this process, when woken and every EMAIL_OUTBOX_POLL_INTERVAL for retries."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.pid: int | None = None
+
+    def wake(self):
+        if not settings.EMAIL_OUTBOX_THREAD:
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                # Threads do not survive a fork, so each gunicorn worker starts its own with its first email
+                self.event = threading.Event()
+                threading.Thread(target=self.run, name="outbox", daemon=True).start()
+                self.pid = os.getpid()
+        self.event.set()
+
+    def run(self):
+        while True:
+            self.event.wait(settings.EMAIL_OUTBOX_POLL_INTERVAL)
+            self.event.clear()
+            try:
+                drain()
+            except Exception as e:
+                logging.warning(f"Unable to send the outbox: {e}")
+            finally:
+                close_old_connections()
+
+
+sender = Sender()
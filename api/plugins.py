@@ -0,0 +1,21 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+
+class PluginMount(type):
+    """
+    The metaclass of a plugin mount point (see scripts/research/plugin_prototype.py): the class declaring it gets a
+    `plugins` list, and every subclass of it is appended to that list as it is defined.
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super().__init__(name, bases, attrs)
+        if not hasattr(cls, "plugins"):
+            # The mount point itself
+            cls.plugins = []
+        else:
+            cls.plugins.append(cls)
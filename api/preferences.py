@@ -0,0 +1,78 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+A user's preferences, watchlists and saved layouts, read together in a constant number of queries and cached per user
+in the "preferences" cache. Saving or deleting any of them deletes the cached entry when the transaction commits (see
+`invalidate`, connected in ApiConfig.ready). Bulk operations send no signals, after them call `invalidate_user`.
+The rows are always read from the default database: a lagging replica (see copilot/database.py) would otherwise cache
+rows older than the invalidation that made the entry be read again.
+"""
+
+from dataclasses import dataclass, field
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Prefetch
+
+from api.models import UserPreferences, Watchlist, WatchlistSymbol
+
+
+@dataclass
+class Preferences:
+    dark_mode: bool = True
+    layouts: dict = field(default_factory=dict)
+    # Watchlist names to their symbols, both in the user's order
+    watchlists: dict[str, list[str]] = field(default_factory=dict)
+
+
+def get_cache():
+    return caches["preferences"]
+
+
+def cache_key(user_id: int) -> str:
+    return f"preferences:{user_id}"
+
+
+def watchlists_with_symbols(using: str = DEFAULT_DB_ALIAS):
+    """Watchlists with their symbols prefetched, two queries however many lists and symbols there are."""
+    return Watchlist.objects.using(using).prefetch_related(
+        Prefetch("symbols", queryset=WatchlistSymbol.objects.using(using).only("watchlist_id", "symbol", "position"))
+    )
+
+
+def load_preferences(user_id: int) -> Preferences:
+    stored = UserPreferences.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).first()
+    preferences = Preferences(dark_mode=stored.dark_mode, layouts=stored.layouts) if stored else Preferences()
+    for watchlist in watchlists_with_symbols().filter(user_id=user_id):
+        preferences.watchlists[watchlist.name] = [item.symbol for item in watchlist.symbols.all()]
+    return preferences
+
+
+def get_preferences(user) -> Preferences:
+    key = cache_key(user.pk)
+    preferences = get_cache().get(key)
+    if preferences is None:
+        preferences = load_preferences(user.pk)
+        get_cache().set(key, preferences)
+    return preferences
+
+
+def invalidate_user(user_id: int):
+    get_cache().delete(cache_key(user_id))
+
+
+def invalidate(sender, instance, origin=None, using=None, **kwargs):
+    """
+    The post_save and post_delete receiver of UserPreferences, Watchlist and WatchlistSymbol. The entry is deleted once
+    the transaction commits, a read in between would cache the rows as they were until the TTL.
+    """
+    if isinstance(instance, WatchlistSymbol):
+        # A delete that started from its watchlist or user (an instance or a queryset) invalidates through theirs
+        if origin is not None and origin is not instance and getattr(origin, "model", None) is not WatchlistSymbol:
+            return
+        instance = instance.watchlist
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user(user_id), using=using)
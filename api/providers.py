@@ -0,0 +1,213 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+from api.instrumentation import registry
+from api.lazy import obb, pd
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# Environment variables holding the OpenBB credential for each provider, the credential name is `<provider>_api_key`
+PROVIDER_CREDENTIALS = {
+    "alpha_vantage": "ALPHA_VANTAGE_API_KEY",
+    "fmp": "FMP_API_KEY",
+    "intrinio": "INTRINIO_API_KEY",
+    "polygon": "POLYGON_API_KEY",
+    "tiingo": "TIINGO_TOKEN",
+}
+
+# How a provider spells a base interval (see resample.BASE_INTERVALS) where it differs, Alpha Vantage only takes "60m"
+PROVIDER_INTERVALS = {"alpha_vantage": {"1h": "60m"}}
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Provider:
+    name = ""
+
+    def fetch(self, symbol: str, interval: str = "1d") -> "DataFrame":
+        raise NotImplementedError
+
+
+class OpenBBProvider(Provider):
+    def __init__(self, name: str):
+        self.name = name
+
+    def fetch(self, symbol: str, interval: str = "1d") -> "DataFrame":
+        credential_env = PROVIDER_CREDENTIALS.get(self.name)
+        if credential_env:
+            setattr(obb.user.credentials, f"{self.name}_api_key", os.getenv(credential_env))
+        interval = provider_interval(self.name, interval)
+        historical_data = obb.equity.price.historical(symbol=symbol, interval=interval, provider=self.name)
+        return historical_data.to_df()
+
+
+def provider_interval(name: str, interval: str) -> str:
+    return PROVIDER_INTERVALS.get(name, {}).get(interval, interval)
+
+
+def normalize_frame(df: "DataFrame") -> "DataFrame":
+    """Convert a provider frame to the shared schema: a sorted naive UTC DatetimeIndex named `date` and OHLCV floats."""
+    if df is None or len(df) == 0:
+        raise ProviderError("No data returned")
+    df = df.rename(columns=lambda column: str(column).lower().replace(" ", "_"))
+    if "date" in df.columns:
+        df = df.set_index("date")
+    missing = [column for column in OHLCV_COLUMNS if column not in df.columns]
+    if missing:
+        raise ProviderError(f"Missing columns: {', '.join(missing)}")
+    df = df[OHLCV_COLUMNS].astype(float)
+    index = pd.to_datetime(df.index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    df.index = index
+    df.index.name = "date"
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    return df
+
+
+class LatencyTracker:
+    """Rolling window of successful fetch latencies, the p95 of which is the budget before a hedge is fired."""
+
+    def __init__(self, default_budget: float, window: int = 100, min_samples: int = 20):
+        self.default_budget = default_budget
+        self.min_samples = min_samples
+        self.samples: deque = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def budget(self) -> float:
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return self.default_budget
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class ProviderChain:
+    """
+    Fetch from providers in order. When the latest provider has not answered within its p95 budget the next one is
+    fired as a hedge, and when a provider fails the next one is used as a fallback. The first valid result wins.
+    """
+
+    def __init__(self, providers: list[Provider], executor: ThreadPoolExecutor | None = None, default_budget=None):
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.providers = providers
+        self.executor = executor or _get_executor()
+        if default_budget is None:
+            self.trackers = {provider.name: _get_tracker(provider.name) for provider in providers}
+        else:
+            self.trackers = {provider.name: LatencyTracker(default_budget) for provider in providers}
+
+    def _launch(self, provider: Provider, symbol: str, interval: str):
+        tracker = self.trackers[provider.name]
+        start = time.monotonic()
+
+        def run():
+            registry.inc("copilot_upstream_requests_total", provider=provider.name)
+            df = normalize_frame(provider.fetch(symbol, interval))
+            # Record late answers too, otherwise a slow provider never gets to prove its real latency
+            tracker.record(time.monotonic() - start)
+            return df
+
+        return self.executor.submit(run), start + tracker.budget()
+
+    def fetch(self, symbol: str, interval: str = "1d") -> "DataFrame":
+        pending: dict[Future, Provider] = {}
+        errors: list[tuple[str, Exception]] = []
+        next_index = 0
+        deadline: float | None = None
+        while True:
+            if not pending or (deadline is not None and time.monotonic() >= deadline):
+                if next_index >= len(self.providers):
+                    if not pending:
+                        if len(errors) == 1:
+                            raise errors[0][1]
+                        raise ProviderError(f"All providers failed: {'; '.join(f'{n}: {e}' for n, e in errors)}")
+                    deadline = None
+                else:
+                    provider = self.providers[next_index]
+                    next_index += 1
+                    if pending:
+                        logging.info(f"Hedging '{symbol}' with provider '{provider.name}'")
+                    future, deadline = self._launch(provider, symbol, interval)
+                    pending[future] = provider
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    df = future.result()
+                except Exception as e:
+                    registry.inc("copilot_upstream_errors_total", provider=provider.name)
+                    logging.warning(f"Provider '{provider.name}' failed for '{symbol}': {e}")
+                    errors.append((provider.name, e))
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                return df
+
+
+_executor = None
+_trackers: dict[str, LatencyTracker] = {}
+_lock = threading.Lock()
+
+PROVIDER_FACTORIES = {}
+
+
+def register_provider(name: str, factory):
+    PROVIDER_FACTORIES[name] = factory
+
+
+def get_provider(name: str) -> Provider:
+    factory = PROVIDER_FACTORIES.get(name)
+    if factory:
+        return factory()
+    return OpenBBProvider(name)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.MARKET_DATA_HEDGE_WORKERS, thread_name_prefix="market-data"
+            )
+        return _executor
+
+
+def _get_tracker(name: str) -> LatencyTracker:
+    with _lock:
+        if name not in _trackers:
+            _trackers[name] = LatencyTracker(settings.MARKET_DATA_HEDGE_BUDGET)
+        return _trackers[name]
+
+
+def get_provider_chain() -> ProviderChain:
+    return ProviderChain([get_provider(name.strip()) for name in settings.MARKET_DATA_PROVIDERS if name.strip()])
+
+
+def fetch_historical(symbol: str, interval: str = "1d") -> "DataFrame":
+    return get_provider_chain().fetch(symbol, interval)
@@ -0,0 +1,93 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import re
+from typing import TYPE_CHECKING
+
+from api.lazy import np, pd
+from api.market_calendar import MARKET_OPEN, MARKET_TIMEZONE
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+# Fetched from the providers, every other interval is resampled from one of these
+BASE_INTERVALS = ["1m", "5m", "15m", "30m", "1h", "1d"]
+INTERVAL_PATTERN = re.compile(r"(\d*)([mhdWMQY])")
+
+
+def parse_interval(interval: str) -> tuple[int, str]:
+    """Split "15m" into (15, "m"), units are minutes, hours, (trading) days, weeks, months, quarters and years."""
+    match = INTERVAL_PATTERN.fullmatch(interval)
+    if not match or int(match.group(1) or 1) == 0:
+        raise ValueError(f"Invalid interval '{interval}', e.g. 15m, 1h, 1d, 3d, 1W, 1M, 1Q or 1Y")
+    return int(match.group(1) or 1), match.group(2)
+
+
+def normalize_interval(interval: str) -> str:
+    count, unit = parse_interval(interval)
+    if unit == "m" and count % 60 == 0:
+        count, unit = count // 60, "h"
+    return f"{count}{unit}"
+
+
+def base_interval(interval: str) -> str:
+    """The provider interval `interval` is resampled from (itself when it is one)."""
+    interval = normalize_interval(interval)
+    if interval in BASE_INTERVALS:
+        return interval
+    count, unit = parse_interval(interval)
+    if unit == "h":
+        return "1h"
+    if unit == "m":
+        # The coarsest base interval whose bars fit evenly, so fewer bars are fetched
+        return next(base for base in reversed(BASE_INTERVALS[:4]) if count % parse_interval(base)[0] == 0)
+    return "1d"
+
+
+def group_keys(index: "pd.DatetimeIndex", count: int, unit: str) -> "np.ndarray":
+    """An integer per bar that changes exactly where a resampled bar starts."""
+    if unit in "mh":
+        # Intraday bars are anchored at the session open, as the providers do
+        local = index.tz_localize("UTC").tz_convert(MARKET_TIMEZONE)
+        minutes = (local.hour * 60 + local.minute - (MARKET_OPEN.hour * 60 + MARKET_OPEN.minute)).to_numpy()
+        days = local.tz_localize(None).normalize().to_numpy().astype("datetime64[D]").astype(np.int64)
+        step = count * (60 if unit == "h" else 1)
+        return days * (24 * 60) + minutes // step
+    if unit == "d":
+        return np.arange(len(index)) // count  # N trading days, not calendar days
+    values = index.to_numpy()
+    if unit == "W":
+        # 1970-01-01 was a Thursday, weeks start on Monday
+        return (values.astype("datetime64[D]").astype(np.int64) + 3) // 7 // count
+    if unit == "M":
+        return values.astype("datetime64[M]").astype(np.int64) // count
+    if unit == "Q":
+        return values.astype("datetime64[M]").astype(np.int64) // (3 * count)
+    return values.astype("datetime64[Y]").astype(np.int64) // count
+
+
+def resample(df: "DataFrame", interval: str) -> "DataFrame":
+    """
+    Aggregate a normalized OHLCV frame (see `providers.normalize_frame`) into `interval` bars: first open, highest high,
+    lowest low, last close and summed volume, each labelled with the time of its first bar.
+    """
+    if df.empty:
+        return df.copy()
+    count, unit = parse_interval(normalize_interval(interval))
+    keys = group_keys(df.index, count, unit)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    ends = np.concatenate([starts[1:], [len(df)]]) - 1
+    return pd.DataFrame(
+        {
+            "open": df["open"].to_numpy()[starts],
+            "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+            "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+            "close": df["close"].to_numpy()[ends],
+            "volume": np.add.reduceat(df["volume"].to_numpy(), starts),
+        },
+        index=df.index[starts],
+    )
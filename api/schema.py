@@ -6,13 +6,29 @@ See the LICENSE file in the root of this project for the full license text.
 """
 
 import csv
+import hashlib
 import os
+from datetime import date, timedelta
+from typing import TYPE_CHECKING
 
 import graphene
-import pandas as pd
 import requests
-from openbb import obb
-from pandas.core.frame import DataFrame
+from django.conf import settings
+from graphene.types.generic import GenericScalar
+
+from api import backtest
+from api import indicators as indicator_registry
+from api.earnings import EarningsCalendar
+from api.instrumentation import timer
+from api.lazy import obb, pd
+from api.market_calendar import ttl
+from api.market_data import cached, get_bars
+from api.preferences import get_preferences
+from api.resample import normalize_interval
+from api.series import compact, expand
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
 class OHLCData(graphene.ObjectType):
@@ -35,6 +51,23 @@ class KcData(graphene.ObjectType):
     y = graphene.List(graphene.Float)
 
 
+class IndicatorSpec(graphene.InputObjectType):
+    name = graphene.String(required=True)
+    params = GenericScalar()
+
+
+class IndicatorPoint(graphene.ObjectType):
+    x = graphene.DateTime()
+    y = graphene.List(graphene.Float)
+
+
+class IndicatorSeries(graphene.ObjectType):
+    name = graphene.String()
+    params = GenericScalar()
+    columns = graphene.List(graphene.String)
+    data = graphene.List(IndicatorPoint)
+
+
 class EarningsData(graphene.ObjectType):
     symbol = graphene.String()
     name = graphene.String()
@@ -42,6 +75,8 @@ class EarningsData(graphene.ObjectType):
     fiscalDateEnding = graphene.DateTime()
     estimate = graphene.Float()
     currency = graphene.String()
+    # Position of the first bar at or after the report date in the chart's bars, null after the last bar
+    barIndex = graphene.Int()
 
 
 class GraphQLData(graphene.ObjectType):
@@ -54,8 +89,49 @@ class ChartData(GraphQLData):
     volume = graphene.List(VolumeData)
     squeeze = graphene.List(SqueezeData)
     kc = graphene.List(KcData)
+    indicators = graphene.List(IndicatorSeries)
     earnings = graphene.List(EarningsData)
     ticker = graphene.String()
+    interval = graphene.String()
+
+
+class BacktestStats(graphene.ObjectType):
+    total_return = graphene.Float()
+    cagr = graphene.Float()
+    sharpe = graphene.Float()
+    max_drawdown = graphene.Float()
+    exposure = graphene.Float()
+    trades = graphene.Int()
+    win_rate = graphene.Float()
+
+
+class BacktestTrade(graphene.ObjectType):
+    entry = graphene.DateTime()
+    exit = graphene.DateTime()
+    entry_price = graphene.Float()
+    exit_price = graphene.Float()
+    return_ = graphene.Float(name="return")
+
+
+class EquityData(graphene.ObjectType):
+    x = graphene.DateTime()
+    y = graphene.Float()
+
+
+class Backtest(GraphQLData):
+    ticker = graphene.String()
+    interval = graphene.String()
+    entry = graphene.String()
+    exit = graphene.String()
+    stats = graphene.Field(BacktestStats)
+    equity = graphene.List(EquityData)
+    trades = graphene.List(BacktestTrade)
+
+
+class EarningsCalendarData(GraphQLData):
+    start = graphene.Date()
+    end = graphene.Date()
+    earnings = graphene.List(EarningsData)
 
 
 class TickerData(graphene.ObjectType):
@@ -68,6 +144,60 @@ class Autocomplete(GraphQLData):
     results = graphene.List(TickerData)
 
 
+class WatchlistData(graphene.ObjectType):
+    name = graphene.String()
+    symbols = graphene.List(graphene.String)
+
+
+class PreferencesData(GraphQLData):
+    dark_mode = graphene.Boolean()
+    layouts = GenericScalar()
+    watchlists = graphene.List(WatchlistData)
+
+
+def resolve_get_preferences(self, info) -> PreferencesData:
+    user = info.context.user
+    if not user or not user.is_authenticated:
+        raise Exception("Authentication credentials were not provided or are invalid")
+
+    with timer("preferences"):
+        preferences = get_preferences(user)
+    return PreferencesData(
+        success=True,
+        dark_mode=preferences.dark_mode,
+        layouts=preferences.layouts,
+        watchlists=[WatchlistData(name=name, symbols=symbols) for name, symbols in preferences.watchlists.items()],
+    )
+
+
+def resolve_get_earnings_calendar(
+    self, info, start=None, end=None, universe=None, watchlist=None
+) -> EarningsCalendarData:
+    user = info.context.user
+    if not user or not user.is_authenticated:
+        raise Exception("Authentication credentials were not provided or are invalid")
+
+    start = start or date.today()
+    end = end or start + timedelta(days=6)
+    if end < start:
+        return EarningsCalendarData(success=False, message="The end is before the start")
+    if watchlist is not None:
+        symbols = get_preferences(user).watchlists.get(watchlist)
+        if symbols is None:
+            return EarningsCalendarData(success=False, message=f"No watchlist '{watchlist}'")
+        universe = symbols if universe is None else [symbol for symbol in universe if symbol.upper() in symbols]
+
+    with timer("earnings"):
+        calendar = load_earnings_calendar()
+    if calendar is None:
+        return EarningsCalendarData(success=False, message="Failed to load the earnings calendar")
+    with timer("serialize"):
+        reports = calendar.between(start, end, universe).records()
+        return EarningsCalendarData(
+            success=True, start=start, end=end, earnings=[EarningsData(**report) for report in reports]
+        )
+
+
 def resolve_get_autocomplete(self, info, query) -> Autocomplete:
     user = info.context.user
     if not user or not user.is_authenticated:
@@ -77,7 +207,8 @@ def resolve_get_autocomplete(self, info, query) -> Autocomplete:
 
     if query:
         try:
-            response = obb.equity.search(query)  # type: ignore
+            with timer("search"):
+                response = obb.equity.search(query)  # type: ignore
 
             return Autocomplete(success=True, results=response.results)
 
@@ -88,7 +219,7 @@ def resolve_get_autocomplete(self, info, query) -> Autocomplete:
         return Autocomplete(success=False, message="No query provided")
 
 
-def resolve_get_chart_data(self, info, ticker):
+def resolve_get_chart_data(self, info, ticker, interval="1d", indicators=None):
     user = info.context.user
     if not user or not user.is_authenticated:
         raise Exception("Authentication credentials were not provided or are invalid")
@@ -97,11 +228,11 @@ def resolve_get_chart_data(self, info, ticker):
 
     if ticker:
         try:
-            # Assuming 'obb' is defined and setup elsewhere to use Alpha Vantage API
-            alpha_vantage_api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
-            obb.user.credentials.alpha_vantage_api_key = alpha_vantage_api_key
-            historical_data = obb.equity.price.historical(symbol=ticker, provider="alpha_vantage")
-            df = historical_data.to_df()
+            # Only the requested indicators are computed, the default set otherwise
+            requested = None
+            if indicators is not None:
+                requested = [indicator_registry.from_spec(dict(spec)) for spec in indicators]
+            df = load_indicator_frame(ticker, interval, indicators=requested)
 
             # Prepare OHLC, Volume, and Squeeze data
             ohlc_data = []
@@ -109,41 +240,50 @@ def resolve_get_chart_data(self, info, ticker):
             squeeze_data = []
             kc_data = []
 
-            earnings_df = get_earnings_dates(ticker, alpha_vantage_api_key)
-            earnings_data = parse_earnings_data(earnings_df)
-
-            df.ta.kc(append=True, scalar=1)
-            df.ta.kc(append=True, scalar=2)
-            df.ta.kc(append=True, scalar=3)
-
-            # Assuming squeeze function is correctly imported and used
-            df.ta.squeeze(append=True)
-            df.fillna(0, inplace=True)  # Replace NaN with 0
-            for timestamp, row in df.iterrows():
-                ohlc_data.append(OHLCData(x=timestamp, y=[row["open"], row["high"], row["low"], row["close"]]))
-                volume_data.append(VolumeData(x=timestamp, y=row["volume"]))
-                squeeze_data.append(
-                    SqueezeData(
-                        x=timestamp,
-                        y=[row["SQZ_ON"], row["SQZ_20_2.0_20_1.5"]],
+            with timer("earnings"):
+                earnings_df = load_earnings(ticker)
+                earnings_data = parse_earnings_data(earnings_df, df.index)
+
+            with timer("serialize"):
+                if requested is not None:
+                    times = [to_bar_time(timestamp) for timestamp in df.index]
+                    ohlc = df[["open", "high", "low", "close"]].to_numpy().tolist()
+                    return ChartData(
+                        success=True,
+                        ohlc=[OHLCData(x=x, y=y) for x, y in zip(times, ohlc)],
+                        volume=[VolumeData(x=x, y=y) for x, y in zip(times, df["volume"].tolist())],
+                        indicators=[serialize_indicator(df, times, indicator) for indicator in requested],
+                        ticker=ticker,
+                        interval=normalize_interval(interval),
+                        earnings=earnings_data,
+                    )
+
+                for timestamp, row in df.iterrows():
+                    x = to_bar_time(timestamp)
+                    ohlc_data.append(OHLCData(x=x, y=[row["open"], row["high"], row["low"], row["close"]]))
+                    volume_data.append(VolumeData(x=x, y=row["volume"]))
+                    squeeze_data.append(
+                        SqueezeData(
+                            x=x,
+                            y=[row["SQZ_ON"], row["SQZ_20_2.0_20_1.5"]],
+                        )
                     )
-                )
-                kc_data.append(
-                    KcData(
-                        x=timestamp,
-                        y=[
-                            row["KCLe_20_1.0"],
-                            row["KCBe_20_1.0"],
-                            row["KCUe_20_1.0"],
-                            row["KCLe_20_2.0"],
-                            row["KCBe_20_2.0"],
-                            row["KCUe_20_2.0"],
-                            row["KCLe_20_3.0"],
-                            row["KCBe_20_3.0"],
-                            row["KCUe_20_3.0"],
-                        ],
+                    kc_data.append(
+                        KcData(
+                            x=x,
+                            y=[
+                                row["KCLe_20_1.0"],
+                                row["KCBe_20_1.0"],
+                                row["KCUe_20_1.0"],
+                                row["KCLe_20_2.0"],
+                                row["KCBe_20_2.0"],
+                                row["KCUe_20_2.0"],
+                                row["KCLe_20_3.0"],
+                                row["KCBe_20_3.0"],
+                                row["KCUe_20_3.0"],
+                            ],
+                        )
                     )
-                )
 
             return ChartData(
                 success=True,
@@ -152,6 +292,7 @@ def resolve_get_chart_data(self, info, ticker):
                 squeeze=squeeze_data,
                 kc=kc_data,
                 ticker=ticker,
+                interval=normalize_interval(interval),
                 earnings=earnings_data,
             )
 
@@ -162,22 +303,172 @@ def resolve_get_chart_data(self, info, ticker):
         return ChartData(success=False, message="No ticker provided")
 
 
-def parse_earnings_data(earnings_df: DataFrame) -> list[EarningsData]:
-    earnings_data: list[EarningsData] = []
-    for index, row in earnings_df.iterrows():
-        data = EarningsData(
-            symbol=row["symbol"],
-            name=row["name"],
-            reportDate=pd.to_datetime(row["reportDate"]),
-            fiscalDateEnding=pd.to_datetime(row["fiscalDateEnding"]),
-            estimate=float(row["estimate"]) if row["estimate"] else None,
-            currency=row["currency"],
+def resolve_get_backtest(
+    self,
+    info,
+    ticker,
+    interval="1d",
+    entry=backtest.DEFAULT_ENTRY,
+    exit=backtest.DEFAULT_EXIT,
+    side="long",
+    cost_bps=0.0,
+) -> Backtest:
+    user = info.context.user
+    if not user or not user.is_authenticated:
+        raise Exception("Authentication credentials were not provided or are invalid")
+
+    ticker = ticker.upper()
+    if not ticker:
+        return Backtest(success=False, message="No ticker provided")
+
+    try:
+        strategy = backtest.Strategy(entry=entry, exit=exit, side=side, cost_bps=cost_bps)
+        interval = normalize_interval(interval)
+        with timer("fetch"):
+            df = get_bars(ticker, interval)
+        with timer("backtest"):
+            result = backtest.run(ticker, df, strategy)
+        with timer("serialize"):
+            times = [to_bar_time(timestamp) for timestamp in result.index]
+            return Backtest(
+                success=True,
+                ticker=ticker,
+                interval=interval,
+                entry=strategy.entry,
+                exit=strategy.exit,
+                stats=BacktestStats(**result.stats),
+                equity=[EquityData(x=x, y=y) for x, y in zip(times, result.equity.tolist())],
+                trades=[
+                    BacktestTrade(
+                        **{key: value for key, value in trade.items() if key != "return"}, return_=trade["return"]
+                    )
+                    for trade in result.trades
+                ],
+            )
+    except Exception as e:
+        return Backtest(success=False, message=f"Failed to backtest '{ticker}': {e}")
+
+
+def add_indicators(df: "DataFrame"):
+    # The default set, the `squeeze` and `kc` series are read from its columns (e.g. "KCLe_20_1.0")
+    indicator_registry.append(
+        df, [indicator_registry.from_spec(spec) for spec in indicator_registry.DEFAULT_INDICATORS]
+    )
+
+
+def load_indicator_frame(
+    ticker: str, interval: str = "1d", refresh: bool = False, indicators: list | None = None
+) -> "DataFrame":
+    interval = normalize_interval(interval)
+    key = f"{interval}:{ticker}"
+    if indicators is not None:
+        # Frames of other indicator sets are cached separately, keyed by their canonical specs
+        key += ":" + hashlib.sha1(indicator_registry.spec_key(indicators).encode()).hexdigest()[:16]
+
+    def compute():
+        # Providers are tried in the order of settings.MARKET_DATA_PROVIDERS, with hedging and fallback, intervals
+        # they are not asked for are resampled from the stored base series
+        with timer("fetch"):
+            df = get_bars(ticker, interval).copy()
+        with timer("indicators"):
+            if indicators is None:
+                add_indicators(df)
+            else:
+                indicator_registry.append(df, indicators)
+        df.fillna(0, inplace=True)  # Replace NaN with 0
+        return compact(df)
+
+    return expand(cached("indicators", key, compute, refresh=refresh, timeout=ttl(interval)))
+
+
+def serialize_indicator(df: "DataFrame", times: list, indicator) -> IndicatorSeries:
+    columns = indicator.columns
+    rows = df[columns].to_numpy(dtype=float).tolist()
+    return IndicatorSeries(
+        name=indicator.name,
+        params=indicator.params,
+        columns=columns,
+        data=[IndicatorPoint(x=x, y=y) for x, y in zip(times, rows)],
+    )
+
+
+def load_earnings(ticker: str, refresh: bool = False) -> "DataFrame":
+    return cached(
+        "earnings",
+        ticker,
+        lambda: get_earnings_dates(ticker, os.getenv("ALPHA_VANTAGE_API_KEY")),
+        refresh=refresh,
+        timeout=settings.MARKET_DATA_EARNINGS_TTL,
+    )
+
+
+def load_earnings_calendar(refresh: bool = False) -> EarningsCalendar | None:
+    """The calendar of every symbol, one upstream call indexed by report date (see api/earnings.py)."""
+
+    def fetch():
+        df = get_earnings_dates(None, os.getenv("ALPHA_VANTAGE_API_KEY"))
+        # Not cached when the call failed, throttled calls are answered with a JSON message instead of the CSV
+        return EarningsCalendar.from_frame(df) if df is not None and EarningsCalendar.is_calendar(df) else None
+
+    return cached("earnings", "calendar", fetch, refresh=refresh, timeout=settings.MARKET_DATA_EARNINGS_TTL)
+
+
+def to_bar_time(timestamp):
+    # Daily bars are reported as dates (as the providers return them), intraday bars keep their time of day
+    if timestamp == timestamp.normalize():
+        return timestamp.date()
+    return timestamp.to_pydatetime()
+
+
+def bar_offsets(index: "pd.DatetimeIndex", dates: "pd.Series") -> list[int | None]:
+    """The position of the first bar at or after each date, None for a missing date or one after the last bar."""
+    dates = pd.DatetimeIndex(dates)
+    if index.tz is not None:
+        dates = dates.tz_localize(index.tz)
+    offsets = index.searchsorted(dates, side="left")
+    valid = ~dates.isna() & (offsets < len(index))
+    return [int(offset) if ok else None for offset, ok in zip(offsets.tolist(), valid.tolist())]
+
+
+def optional(values: "pd.Series") -> list:
+    """The values as Python objects, with None for the missing ones."""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def parse_earnings_data(earnings_df: "DataFrame | None", index: "pd.DatetimeIndex | None" = None) -> list[EarningsData]:
+    """
+    The reports of the earnings calendar, parsed a column at a time. With the chart's bar `index` each report also gets
+    the offset of its bar, so the client can place the marker without matching dates itself.
+    """
+    if earnings_df is None or earnings_df.empty:
+        return []
+    report_dates = pd.to_datetime(earnings_df["reportDate"], errors="coerce")
+    offsets = bar_offsets(index, report_dates) if index is not None else [None] * len(earnings_df)
+    columns = zip(
+        earnings_df["symbol"].tolist(),
+        earnings_df["name"].tolist(),
+        optional(report_dates),
+        optional(pd.to_datetime(earnings_df["fiscalDateEnding"], errors="coerce")),
+        optional(pd.to_numeric(earnings_df["estimate"], errors="coerce")),
+        earnings_df["currency"].tolist(),
+        offsets,
+    )
+    return [
+        EarningsData(
+            symbol=symbol,
+            name=name,
+            reportDate=report_date,
+            fiscalDateEnding=fiscal_date_ending,
+            estimate=estimate,
+            currency=currency,
+            barIndex=offset,
         )
-        earnings_data.append(data)
-    return earnings_data
+        for symbol, name, report_date, fiscal_date_ending, estimate, currency, offset in columns
+    ]
 
 
 def get_earnings_dates(symbol, api_key):
+    """The earnings calendar of the next 12 months for `symbol`, or for every symbol when it is None."""
     try:
         # Cannot use the obb.equity.calendar.earnings function because it only supports the "fmp" provider
         # See: .venv/lib/python3.11/site-packages/openbb/package/equity.py
@@ -186,7 +477,7 @@ def get_earnings_dates(symbol, api_key):
             f"https://www.alphavantage.co/query"
             f"?function=EARNINGS_CALENDAR"
             f"&horizon=12month"
-            f"&symbol={symbol}"
+            f"{f'&symbol={symbol}' if symbol else ''}"
             f"&apikey={api_key}"
         )
 
@@ -210,8 +501,29 @@ class Query(graphene.ObjectType):
     get_chart_data = graphene.Field(
         ChartData,
         ticker=graphene.String(required=True),
+        interval=graphene.String(default_value="1d"),
+        indicators=graphene.List(IndicatorSpec),
         resolver=resolve_get_chart_data,  # Connect the resolver to the field
     )
+    get_backtest = graphene.Field(
+        Backtest,
+        ticker=graphene.String(required=True),
+        interval=graphene.String(default_value="1d"),
+        entry=graphene.String(default_value=backtest.DEFAULT_ENTRY),
+        exit=graphene.String(default_value=backtest.DEFAULT_EXIT),
+        side=graphene.String(default_value="long"),
+        cost_bps=graphene.Float(default_value=0.0),
+        resolver=resolve_get_backtest,
+    )
+    get_earnings_calendar = graphene.Field(
+        EarningsCalendarData,
+        start=graphene.Date(),
+        end=graphene.Date(),
+        universe=graphene.List(graphene.String),
+        watchlist=graphene.String(),
+        resolver=resolve_get_earnings_calendar,
+    )
+    get_preferences = graphene.Field(PreferencesData, resolver=resolve_get_preferences)
     get_autocomplete = graphene.Field(
         Autocomplete,
         query=graphene.String(required=True),
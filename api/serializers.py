@@ -6,38 +6,58 @@ See the LICENSE file in the root of this project for the full license text.
 """
 
 import logging
-from smtplib import SMTPException
-from typing import Dict
+from typing import Dict, cast
 
 from allauth.account.models import EmailAddress
 from allauth.account.utils import user_pk_to_url_str
+from dj_rest_auth.serializers import LoginSerializer as RestAuthLoginSerializer
 from dj_rest_auth.serializers import PasswordResetSerializer
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, update_last_login
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
 from django.utils.safestring import mark_safe
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from api.authentication import get_login_user
 from copilot import settings
 
 
 # TODO: No longer used, right?
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs) -> Dict[str, str]:
-        try:
-            user = User.objects.get(username=attrs["username"])
-            if user is None:
-                user = User.objects.get(email=attrs["username"])  # See if username is email
-        except User.DoesNotExist:
+        # The user and whether its email is verified in one query, instead of authenticating it again afterwards
+        user = get_login_user(attrs[self.username_field])
+        if user is None:
             raise serializers.ValidationError({"email": "User with this username or email does not exist."})
-        if not EmailAddress.objects.filter(user=user, email=user.email, verified=True).exists():
+        if not user.email_verified:
             raise serializers.ValidationError(
                 {"email": "Email is not verified. Please verify your email before logging in."}
             )
-        data = super().validate(attrs)
-        return data
+        if not user.check_password(attrs["password"]) or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        self.user = user
+        refresh = cast(RefreshToken, self.get_token(user))  # TokenObtainPairSerializer.token_class
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(type(user), user)
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+class LoginSerializer(RestAuthLoginSerializer):
+    @staticmethod
+    def validate_email_verification_status(user, email=None):
+        # Already checked by VerifiedEmailBackend, in the query that loaded the user
+        if not getattr(user, "email_verified", False):
+            RestAuthLoginSerializer.validate_email_verification_status(user, email)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # In place of the session login (REST_AUTH["SESSION_LOGIN"]), the API authenticates with JWTs
+        update_last_login(type(attrs["user"]), attrs["user"])
+        return attrs
 
 
 def url_generator(request, user, token):
@@ -86,12 +106,10 @@ class RegisterSerializer(serializers.ModelSerializer):
                     verified=False,
                 )
 
-                # Send verification email
+                # Queued, and sent once the transaction commits (see api/outbox.py). Failing to queue it rolls back
+                # the user as well
                 email_address.send_confirmation()
             return user
-        except SMTPException as e:
-            logging.exception(f"Failed to send verification email: {str(e)}")
-            raise serializers.ValidationError({"email": "Failed to send verification email."})
         except ValidationError as e:
             logging.exception(f"Validation error: {str(e)}")
             raise
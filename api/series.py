@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+from api.lazy import np, pd
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+INTEGER_TYPES = ["int8", "int16", "int32", "int64"]
+
+
+def compact_column(values: "np.ndarray", atol: float) -> "np.ndarray":
+    """
+    The smallest representation that gives the values back: the smallest integer type for integral columns (volume,
+    squeeze flags), float32 when no value moves more than `atol` and float64 otherwise.
+    """
+    if values.dtype.kind not in "fiu":
+        return values
+    if values.dtype.kind in "iu" or (np.isfinite(values).all() and (values == np.round(values)).all()):
+        low, high = (values.min(), values.max()) if len(values) else (0, 0)
+        dtype = next((t for t in INTEGER_TYPES if np.iinfo(t).min <= low and high <= np.iinfo(t).max), None)
+        if dtype:
+            return values.astype(dtype)
+    with np.errstate(invalid="ignore", over="ignore"):
+        narrow = values.astype(np.float32)
+        error = np.abs(narrow.astype(np.float64) - values)
+    # NaN must stay NaN (and only NaN), overflow to inf shows up as an infinite error
+    if np.array_equal(np.isnan(narrow), np.isnan(values)) and np.nan_to_num(error, nan=0.0).max(initial=0.0) <= atol:
+        return narrow
+    return values.astype(np.float64)
+
+
+class CompactFrame:
+    """
+    A normalized frame (DatetimeIndex plus numeric columns) as it is held in the cache: epoch seconds and one compacted
+    array per column, see `compact_column`. `to_frame` restores the original dtypes.
+    """
+
+    __slots__ = ("ts", "columns", "dtypes", "name")
+
+    def __init__(self, ts: "np.ndarray", columns: dict[str, "np.ndarray"], dtypes: dict[str, str], name=None):
+        self.ts = ts
+        self.columns = columns
+        self.dtypes = dtypes
+        self.name = name
+
+    @classmethod
+    def from_frame(cls, df: "DataFrame", atol: float | None = None) -> "CompactFrame":
+        atol = settings.MARKET_DATA_COMPACT_ATOL if atol is None else atol
+        ts = df.index.values.astype("datetime64[s]").astype(np.int64)
+        columns = {column: compact_column(df[column].to_numpy(), atol) for column in df.columns}
+        return cls(ts, columns, {column: str(dtype) for column, dtype in df.dtypes.items()}, df.index.name)
+
+    def to_frame(self) -> "DataFrame":
+        index = pd.DatetimeIndex(self.ts.astype("datetime64[s]").astype("datetime64[ns]"), name=self.name)
+        return pd.DataFrame(
+            {column: values.astype(self.dtypes[column], copy=False) for column, values in self.columns.items()},
+            index=index,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.ts.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+def compact(df: "DataFrame") -> "CompactFrame | DataFrame":
+    return CompactFrame.from_frame(df) if settings.MARKET_DATA_COMPACT else df
+
+
+def expand(value: "CompactFrame | DataFrame | None") -> "DataFrame | None":
+    # Frames cached before compaction was enabled (or with it disabled) are returned as they are
+    return value.to_frame() if isinstance(value, CompactFrame) else value
@@ -0,0 +1,250 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Cache backend whose entries are memory mapped files, so every gunicorn worker (and the page cache) shares one copy of a
+cached series instead of each worker unpickling its own. Configure it in settings.CACHES:
+
+    "BACKEND": "api.shared_cache.SharedMemoryCache", "LOCATION": "/path/to/cache/dir"
+
+Entries are files named after their key (`history:1d:AAPL`), so the directory is the index by kind, interval and
+symbol. A CompactFrame is laid out as raw, aligned arrays that `get` returns as read-only views on the mapping, the same
+object to every caller in the process. Other values are pickled and, as with Django's own backends, each `get` returns
+a fresh copy. A process keeps the entries it read most recently, at most OPTIONS["MAX_MAPPED"] (1000), and drops an
+entry once it has expired or its file is gone.
+
+Reads take no locks: a writer replaces a file atomically, readers see the old or the new entry and a mapping stays
+valid until its last view is gone. Writers are serialized through a lock file, one at a time.
+"""
+
+import json
+import mmap
+import os
+import pickle
+import random
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.files import locks
+
+from api.lazy import np
+from api.series import CompactFrame
+
+MAGIC = b"CPSHARE1"
+# Magic and header length, followed by the JSON header and the data, which starts (and has each array) aligned
+PREFIX = struct.Struct("<8sQ")
+ALIGNMENT = 64
+SUFFIX = ".shm"
+MAX_MAPPED = 1000
+
+
+def align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class SharedMemoryCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, dir, params):
+        super().__init__(params)
+        self._dir = os.path.abspath(dir)
+        # path -> (inode, mtime, expires, value) of the entries this process has mapped, least recently read first
+        self._mapped: OrderedDict[str, tuple] = OrderedDict()
+        self._max_mapped = max(1, int(params.get("OPTIONS", {}).get("MAX_MAPPED", MAX_MAPPED)))
+        self._mapped_lock = threading.Lock()
+
+    def _key_to_file(self, key, version=None) -> str:
+        key = self.make_and_validate_key(key, version=version)
+        return os.path.join(self._dir, quote(key, safe=":") + SUFFIX)
+
+    def get(self, key, default=None, version=None):
+        path = self._key_to_file(key, version)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._mapped_lock:
+                self._mapped.pop(path, None)
+            return default
+        with self._mapped_lock:
+            entry = self._mapped.get(path)
+        if entry is None or entry[:2] != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                expires, value = self._read(path)
+            except (OSError, ValueError, struct.error):
+                return default
+            entry = (stat.st_ino, stat.st_mtime_ns, expires, value)
+        expires, value = entry[2:]
+        with self._mapped_lock:
+            if expires is not None and expires < time.time():
+                self._mapped.pop(path, None)
+                return default
+            self._mapped[path] = entry
+            self._mapped.move_to_end(path)
+            while len(self._mapped) > self._max_mapped:
+                self._mapped.popitem(last=False)
+        if isinstance(value, bytes):
+            return pickle.loads(value)
+        return value
+
+    def _read(self, path: str) -> tuple:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREFIX.unpack_from(mapping)
+        if magic != MAGIC:
+            raise ValueError(f"Not a shared cache entry: {path}")
+        header_start = PREFIX.size
+        header_end = header_start + header_length
+        header = json.loads(mapping[header_start:header_end])
+        data = align(header_end)
+        if header["type"] == "pickle":
+            # Kept pickled, unpickled by every get
+            value = mapping[data:]
+            mapping.close()
+            return header["expires"], value
+
+        # Views on the mapping, which stays open for as long as one of them is referenced
+        arrays = {
+            name: np.frombuffer(mapping, dtype=dtype, count=length, offset=data + offset)
+            for name, (dtype, offset, length) in header["arrays"].items()
+        }
+        ts = arrays.pop("ts")
+        return header["expires"], CompactFrame(ts, arrays, header["dtypes"], header["name"])
+
+    def _write(self, f, value, expires):
+        header: dict = {"expires": expires}
+        if isinstance(value, CompactFrame):
+            arrays = {"ts": value.ts, **value.columns}
+            arrays = {name: np.ascontiguousarray(values) for name, values in arrays.items()}
+            offset = 0
+            header.update(type="frame", dtypes=value.dtypes, name=value.name, arrays={})
+            for name, values in arrays.items():
+                header["arrays"][name] = [values.dtype.str, offset, len(values)]
+                offset = align(offset + values.nbytes)
+            chunks = [(header["arrays"][name][1], values.tobytes()) for name, values in arrays.items()]
+        else:
+            header["type"] = "pickle"
+            offset = 0
+            chunks = [(0, pickle.dumps(value, self.pickle_protocol))]
+
+        encoded = json.dumps(header).encode()
+        data = align(PREFIX.size + len(encoded))
+        f.write(PREFIX.pack(MAGIC, len(encoded)) + encoded)
+        for chunk_offset, chunk in chunks:
+            f.seek(data + chunk_offset)
+            f.write(chunk)
+        # Every (possibly empty) array must lie within the file to be mapped
+        f.truncate(max(f.tell(), data + offset))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        path = self._key_to_file(key, version)
+        with self._writer():
+            self._set(path, value, timeout)
+
+    def _set(self, path: str, value, timeout):
+        """Replaces the entry, with the writer lock held."""
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir, suffix=".tmp")
+        try:
+            with open(fd, "wb") as f:
+                self._write(f, value, self.get_backend_timeout(timeout))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        path = self._key_to_file(key, version)
+        # Checked and written under one lock, so only one of the processes adding a key succeeds
+        with self._writer():
+            try:
+                expires = self._expires(path)
+            except (OSError, ValueError, struct.error):
+                expires = 0.0  # Missing or unreadable, as good as expired
+            if expires is None or expires >= time.time():
+                return False
+            self._set(path, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self.get(key, version=version)
+        if value is None:
+            return False
+        self.set(key, value, timeout, version)
+        return True
+
+    def delete(self, key, version=None):
+        with self._writer():
+            return self._delete(self._key_to_file(key, version))
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        with self._writer():
+            for path in self._list_cache_files():
+                self._delete(path)
+
+    def _delete(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _writer(self):
+        os.makedirs(self._dir, exist_ok=True)
+        return WriterLock(os.path.join(self._dir, ".writer.lock"))
+
+    def _list_cache_files(self) -> list[str]:
+        try:
+            return [os.path.join(self._dir, name) for name in os.listdir(self._dir) if name.endswith(SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def _expires(self, path: str) -> float | None:
+        with open(path, "rb") as f:
+            _, header_length = PREFIX.unpack(f.read(PREFIX.size))
+            return json.loads(f.read(header_length))["expires"]
+
+    def _cull(self):
+        paths = self._list_cache_files()
+        if len(paths) < self._max_entries:
+            return
+        now = time.time()
+        for path in paths:
+            try:
+                expires = self._expires(path)
+            except (OSError, ValueError, struct.error):
+                continue
+            if expires is not None and expires < now:
+                self._delete(path)
+        paths = self._list_cache_files()
+        if self._cull_frequency and len(paths) >= self._max_entries:
+            for path in random.sample(paths, int(len(paths) / self._cull_frequency)):
+                self._delete(path)
+
+
+class WriterLock:
+    """Exclusive lock held while an entry is written or removed, across threads and processes."""
+
+    thread_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        self.file = open(self.path, "a")
+        locks.lock(self.file, locks.LOCK_EX)
+
+    def __exit__(self, *exc):
+        locks.unlock(self.file)
+        self.file.close()
+        self.thread_lock.release()
@@ -0,0 +1,45 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Tuning of SQLite connections for many concurrent requests, selected with settings.SQLITE_PROFILE and applied to every
+new connection. The "concurrent" profile uses a WAL journal so readers never wait on the writer, and synchronous=NORMAL
+so a commit doesn't fsync (it is still safe from an application crash, a power loss can only lose the last commits).
+Reads go through a memory map, and a busy database is waited on rather than failed on. With CONN_MAX_AGE connections
+outlive requests, so the pragmas are run once per thread instead of once per request.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PROFILES: dict[str, dict] = {
+    # SQLite's own settings. The journal mode is persistent in the file and migration 0002 leaves it WAL, so the
+    # rollback journal is set explicitly
+    "default": {"journal_mode": "DELETE"},
+    "concurrent": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16000,  # KiB
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def get_pragmas(profile: str) -> dict:
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ImproperlyConfigured(f"Unknown SQLITE_PROFILE '{profile}', one of {', '.join(PROFILES)}")
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """The connection_created receiver, see ApiConfig.ready."""
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in get_pragmas(settings.SQLITE_PROFILE).items():
+            cursor.execute(f"PRAGMA {name}={value}")
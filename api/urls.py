@@ -5,12 +5,18 @@ This file is part of Capital Copilot by Perpetuator LLC and is released under th
 See the LICENSE file in the root of this project for the full license text.
 """
 
+from functools import lru_cache
+
 from django.urls import path
 from django.utils.functional import SimpleLazyObject
 from django.views.decorators.csrf import csrf_exempt
 from graphene_django.views import GraphQLView
+from graphql import GraphQLError, OperationType, get_operation_ast, parse
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from api.middleware import is_stateless
+from copilot.database import read_only
+
 
 def get_user(request):
     jwt_auth = JWTAuthentication()
@@ -22,11 +28,33 @@ def get_user(request):
 
 
 class CustomGraphQLView(GraphQLView):
+    def dispatch(self, request, *args, **kwargs):
+        if is_stateless(request):
+            # Without graphene's ensure_csrf_cookie, a token authenticated request has no use for the cookie
+            return GraphQLView.dispatch.__wrapped__(self, request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
     def get_context(self, request):
         # Ensure the user is lazy-loaded, only processed when accessed
         request.user = SimpleLazyObject(lambda: get_user(request))
         return request
 
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if is_query(query, operation_name):
+            with read_only():
+                return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+
+@lru_cache(maxsize=256)
+def is_query(query: str | None, operation_name: str | None) -> bool:
+    """Whether the operation only reads, so that it can be answered from the replica."""
+    try:
+        operation = get_operation_ast(parse(query), operation_name) if query else None
+    except GraphQLError:
+        return False  # Reported by execute_graphql_request
+    return operation is not None and operation.operation == OperationType.QUERY
+
 
 urlpatterns = [
     path("", csrf_exempt(CustomGraphQLView.as_view(graphiql=True)), name="graphql"),
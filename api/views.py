@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+"""
+
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.console import ConsoleError, execute
+from api.export import Export, ExportError
+from api.instrumentation import collect, render
+from api.urls import get_user
+
+
+def metrics(request):
+    """For "Authorization: Bearer <METRICS_TOKEN>" or, without a token, for direct requests from ADMIN_ALLOWED_IPS."""
+    if settings.METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    elif "X-Forwarded-For" in request.headers or request.META.get("REMOTE_ADDR") not in settings.ADMIN_ALLOWED_IPS:
+        # Through the proxy every request comes from the proxy's address
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+@require_POST
+def console(request):
+    """Runs `{"command": "..."}` (see api/console.py) and streams its events back as newline delimited JSON."""
+    try:
+        user = get_user(request)
+    except AuthenticationFailed:
+        user = None
+    if not user:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+    try:
+        events = execute(json.loads(request.body)["command"], user)
+    except ConsoleError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": 'Expected {"command": "..."}'}, status=400)
+    response = StreamingHttpResponse(
+        (json.dumps(event, default=str) + "\n" for event in events), content_type="application/x-ndjson"
+    )
+    response["X-Accel-Buffering"] = "no"  # Otherwise nginx holds the events back until its buffer fills
+    return response
+
+
+@csrf_exempt
+@require_POST
+def export(request):
+    """Streams the bars and indicators asked for (see api/export.py) as CSV or Parquet."""
+    try:
+        user = get_user(request)
+    except AuthenticationFailed:
+        user = None
+    if not user:
+        return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+    try:
+        job = Export.from_request(json.loads(request.body))
+    except ExportError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except ValueError:
+        return JsonResponse({"error": 'Expected {"symbols": [...], ...}'}, status=400)
+    response = StreamingHttpResponse(job.stream(), content_type=job.content_type)
+    response["Content-Disposition"] = f'attachment; filename="{job.filename}"'
+    response["X-Accel-Buffering"] = "no"
+    return response
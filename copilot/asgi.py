@@ -11,4 +11,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "copilot.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.console import (  # noqa: E402, needs the apps loaded by get_asgi_application
+    websocket,
+)
+
+
+async def application(scope, receive, send):
+    # Django doesn't serve WebSockets, the console's is handled by api/console.py
+    if scope["type"] == "websocket" and scope["path"] == "/console/":
+        return await websocket(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,168 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Logging pieces referenced by `settings.LOGGING`. Only the standard library is used here, the classes are loaded while
+Django configures logging, before the apps are ready.
+"""
+
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has, anything else was passed through `extra=`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed through `extra=` included."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        return json.dumps(entry, default=str)
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """The rates of SamplingFilter from "logger=rate,..." (e.g. LOG_SAMPLE_RATES), empty items are skipped."""
+    rates = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, equals, rate = item.partition("=")
+        try:
+            if not equals or not name.strip():
+                raise ValueError
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            raise ValueError(f"Expected logger=rate, e.g. django.db.backends=0.01, not '{item.strip()}'")
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in every `1 / rate` records at or below `level` from the loggers in `rates` (and their children), e.g.
+    {"django.db.backends": 0.01} keeps 1% of the SQL debug records. Records above `level` always pass.
+    """
+
+    def __init__(self, rates: dict[str, float] | None = None, level: str | int = "DEBUG"):
+        super().__init__()
+        self.rates = rates or {}
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.resolved: dict[str, float] = {}
+        self.counters: dict[str, itertools.count] = {}
+
+    def rate(self, name: str) -> float:
+        if name not in self.resolved:
+            parts = name.split(".")
+            prefixes = (".".join(parts[:i]) for i in range(len(parts), 0, -1))
+            self.resolved[name] = next((self.rates[prefix] for prefix in prefixes if prefix in self.rates), 1.0)
+        return self.resolved[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        rate = self.rate(record.name)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        counter = self.counters.setdefault(record.name, itertools.count())
+        return next(counter) % round(1 / rate) == 0
+
+
+class QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room, a full queue must not keep the writer from stopping (and draining) on shutdown
+        self.queue.put(self._sentinel)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a background thread that runs the `targets` (other handlers of the config, by name), so the
+    request thread never waits on a file or console write. When the queue is full records are dropped, not waited on.
+    """
+
+    def __init__(self, targets: list[str], maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        # dictConfig retries a handler whose error says its target is not configured yet, as it does for MemoryHandler.
+        # The configured handlers are only found by name in the private logging._handlers. From Python 3.12 dictConfig
+        # takes the "handlers" of a QueueHandler itself, which replaces this lookup once the project is on 3.12
+        handlers = getattr(logging, "_handlers", None)
+        if handlers is None:
+            raise ValueError("Unable to look up logging targets by name, configure them with dictConfig's 'handlers'")
+        missing = [name for name in targets if name not in handlers]
+        if missing:
+            raise ValueError(f"Logging target not configured yet: {', '.join(missing)}")
+        self.targets = [handlers[name] for name in targets]
+        self.listener: QueueListener | None = None
+        self.pid: int | None = None
+        self.dropped = 0
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            # Threads do not survive a fork, so each gunicorn worker starts its own after the (preloaded) master
+            # configured logging
+            self.queue = queue.Queue(self.queue.maxsize)
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self.pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, they may change before the listener gets to them, but keep the traceback apart so
+        # the target's formatter places it
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        # Wait for the listener to write what was queued so far
+        if self.listener and self.pid == os.getpid():
+            self.queue.join()
+
+    def close(self):
+        if self.listener and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.pid = None
+        super().close()
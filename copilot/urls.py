@@ -23,8 +23,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from api.views import console, export, metrics
+
 urlpatterns = [
+    path("metrics", metrics, name="metrics"),
     path("graphql/", include("api.urls")),
+    path("console/", console, name="console"),
+    path("export/", export, name="export"),
     path("auth/", include("dj_rest_auth.urls")),  # Auth endpoints using JWT
     path("auth/registration/", include("dj_rest_auth.registration.urls")),  # Registration and email verification
     path("accounts/", include("django.contrib.auth.urls")),
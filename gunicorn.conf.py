@@ -0,0 +1,45 @@
+"""
+Copyright (c) 2024 Perpetuator LLC
+
+This file is part of Capital Copilot by Perpetuator LLC and is released under the MIT License.
+See the LICENSE file in the root of this project for the full license text.
+
+Gunicorn reads this file from the working directory. With GUNICORN_PRELOAD=True (the default) the application and the
+heavy modules (OpenBB, pandas, the GraphQL schema) are imported once in the master, so the forked workers
+share those pages copy-on-write instead of each importing them on their first request.
+"""
+
+import gc
+import glob
+import os
+
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+
+def on_starting(server):
+    # Worker metric files are summed by /metrics, drop the ones left behind by a previous run so counters start at zero
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "copilot.settings")
+    from django.conf import settings
+
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")) if settings.METRICS_DIR else []:
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    # Before its pid can be reused by a new worker, whose counts would replace the ones in the file
+    from api.instrumentation import remove_worker
+
+    remove_worker(worker.pid)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from api.lazy import preload
+
+    preload()
+    # Move everything imported so far out of the collector's reach, otherwise the first collection in each worker
+    # touches (and therefore copies) every page holding those objects
+    gc.freeze()